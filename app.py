@@ -35,6 +35,7 @@ class Chat:
     messages: list[MessageParam] = field(default_factory=list)
 
     system_prompt: str = """You are a master SQLite assistant. 
+    Use the describe_schema tool to look up table names and columns instead of querying sqlite_master.
     Your job is to use the tools at your disposal to execute SQL queries and provide the results to the user."""
 
     async def process_query(self, session: ClientSession, query: str) -> str:
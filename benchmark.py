@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import platform
+import resource
+import argparse
+import sqlite3
+import subprocess
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+from loguru import logger
+
+from generate_data import generate
+
+HERE = Path(__file__).resolve().parent
+SERVER = HERE / "mcp_server.py"
+DATA_DIR = HERE / ".bench"
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def build_workload(db_path: Path, iterations: int, seed: int) -> list[tuple[str, str]]:
+    """Fixed mix of (kind, sql): point lookups, joins, aggregates and writes with seeded literals.
+
+    Literals vary per statement so the result cache only helps as much as it
+    would for real traffic.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    users, orders, inventory = (conn.execute(f"SELECT MAX(id) FROM {t}").fetchone()[0] for t in ("users", "purchase_orders", "inventory"))
+    first, last = conn.execute("SELECT MIN(record_date), MAX(record_date) FROM purchase_orders").fetchone()
+    categories = [row[0] for row in conn.execute("SELECT DISTINCT sku_category FROM food_beverage_skus")]
+    skus = [row[0] for row in conn.execute("SELECT sku_name FROM food_beverage_skus LIMIT 200")]
+    conn.close()
+    start = date.fromisoformat(first)
+    days = (date.fromisoformat(last) - start).days
+
+    rng = random.Random(seed)
+
+    def day() -> str:
+        return (start + timedelta(days=rng.randrange(max(days - 30, 1)))).isoformat()
+
+    templates: list[tuple[str, Callable[[], str]]] = [
+        ("point_user", lambda: f"SELECT * FROM users WHERE id = {rng.randint(1, users)}"),
+        ("point_order", lambda: f"SELECT * FROM purchase_orders WHERE id = {rng.randint(1, orders)}"),
+        ("join_user_orders", lambda: (
+            "SELECT u.name, p.sku_name, p.sku_price, p.record_date FROM purchase_orders p "
+            f"JOIN users u ON u.id = p.user_id WHERE p.id BETWEEN {(low := rng.randint(1, orders))} AND {low + 50}"
+        )),
+        ("join_category", lambda: (
+            "SELECT s.sku_name, i.location, i.on_hand_quantity FROM food_beverage_skus s "
+            f"JOIN inventory i ON i.sku_name = s.sku_name WHERE s.sku_category = '{rng.choice(categories)}'"
+        )),
+        ("aggregate_top_skus", lambda: (
+            "SELECT sku_name, COUNT(*) AS orders, SUM(sku_price) AS revenue FROM purchase_orders "
+            f"WHERE record_date BETWEEN '{(d := day())}' AND date('{d}', '+30 days') "
+            "GROUP BY sku_name ORDER BY revenue DESC LIMIT 10"
+        )),
+        ("aggregate_user_spend", lambda: (
+            f"SELECT user_id, COUNT(*), SUM(sku_price) FROM purchase_orders WHERE user_id = {rng.randint(1, users)} GROUP BY user_id"
+        )),
+        ("write_order", lambda: (
+            "INSERT INTO purchase_orders (user_id, sku_name, sku_description, sku_price, record_date) "
+            f"VALUES ({rng.randint(1, users)}, '{rng.choice(skus)}', 'benchmark', {rng.uniform(1, 20):.2f}, '{last}')"
+        )),
+        ("write_stock", lambda: (
+            f"UPDATE inventory SET on_hand_quantity = on_hand_quantity - 1 WHERE id = {rng.randint(1, inventory)}"
+        )),
+    ]
+    return [(kind, make()) for _ in range(iterations) for kind, make in templates]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(latencies: dict[str, list[float]], elapsed: float, errors: int) -> dict[str, Any]:
+    def stats(values: list[float]) -> dict[str, float]:
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        }
+
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        "operations": {kind: stats(values) for kind, values in latencies.items()},
+        "overall": dict(stats(everything), throughput_ops=round(len(everything) / elapsed, 1), errors=errors),
+    }
+
+
+async def drive(call: Callable[[str], Awaitable[str]], workload: list[tuple[str, str]], concurrency: int) -> dict[str, Any]:
+    """Runs the workload through `call` with `concurrency` statements in flight"""
+    latencies: dict[str, list[float]] = {}
+    errors = 0
+    pending = iter(workload)
+
+    async def worker() -> None:
+        nonlocal errors
+        for kind, sql in pending:
+            started = time.perf_counter()
+            text = await call(sql)
+            latencies.setdefault(kind, []).append(time.perf_counter() - started)
+            if text.startswith("❌"):
+                errors += 1
+                logger.warning(f"{kind}: {text[:200]}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def run_direct(db_path: Path, workload: list[tuple[str, str]], concurrency: int, warmup: int) -> dict[str, Any]:
+    """Calls the query_data tool function in-process, skipping MCP transport and JSON-RPC"""
+    os.environ["SQLITE_DB_PATH"] = str(db_path)
+    sys.path.insert(0, str(HERE))
+    import mcp_server
+
+    async with mcp_server.server_lifespan(mcp_server.mcp):
+        for _, sql in workload[:warmup]:
+            await mcp_server.query_data(sql)
+        return await drive(mcp_server.query_data, workload[warmup:], concurrency)
+
+
+async def run_stdio(db_path: Path, workload: list[tuple[str, str]], concurrency: int, warmup: int) -> dict[str, Any]:
+    """Calls query_data through a real stdio ClientSession against a server subprocess"""
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=[str(SERVER)],
+        env={**os.environ, "SQLITE_DB_PATH": str(db_path)},
+    )
+    async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+        await session.initialize()
+
+        async def call(sql: str) -> str:
+            result = await session.call_tool("query_data", {"sql": sql})
+            return getattr(result.content[0], "text", "") if result.content else ""
+
+        for _, sql in workload[:warmup]:
+            await call(sql)
+        return await drive(call, workload[warmup:], concurrency)
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def worker_main(args: argparse.Namespace) -> None:
+    """One (size, mode) run in a fresh process, so peak RSS belongs to that run alone"""
+    workload = build_workload(Path(args.db), args.iterations, args.seed)
+    runner = run_direct if args.worker == "direct" else run_stdio
+    result = asyncio.run(runner(Path(args.db), workload, args.concurrency, args.warmup))
+    result["peak_rss_mb"] = {"benchmark": _peak_rss_mb(resource.RUSAGE_SELF)}
+    if args.worker == "stdio":
+        result["peak_rss_mb"]["server"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    print(json.dumps(result))
+
+
+def dataset(orders: int, seed: int) -> Path:
+    """Generated database for a size, cached across runs since generation is deterministic"""
+    path = DATA_DIR / f"orders_{orders}_seed_{seed}.db"
+    if not path.exists():
+        DATA_DIR.mkdir(exist_ok=True)
+        logger.info(f"Generating {path.name}")
+        generate(path, orders, seed)
+    return path
+
+
+def run_case(orders: int, mode: str, args: argparse.Namespace) -> dict[str, Any]:
+    source = dataset(orders, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Writes in the workload must not leak into the cached dataset or the next run
+        db_path = Path(tmp) / source.name
+        shutil.copyfile(source, db_path)
+        command = [
+            sys.executable, str(Path(__file__).resolve()), "--worker", mode, "--db", str(db_path), "--seed", str(args.seed),
+            "--iterations", str(args.iterations), "--concurrency", str(args.concurrency), "--warmup", str(args.warmup),
+        ]
+        env = dict(os.environ, SQLITE_SLOW_LOG_PATH=str(Path(tmp) / "slow_queries.jsonl"))
+        done = subprocess.run(command, capture_output=True, text=True, env=env, cwd=tmp)
+    if done.returncode != 0:
+        raise RuntimeError(f"{mode} run on {orders:,} orders failed:\n{done.stderr[-2000:]}")
+    result = json.loads(done.stdout.strip().splitlines()[-1])
+    return {"orders": orders, "mode": mode, "concurrency": args.concurrency, **result}
+
+
+def compare(results: list[dict[str, Any]], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Operations whose p95 latency or overall throughput got worse than the baseline by more than `tolerance`"""
+    previous = {(r["orders"], r["mode"], r.get("concurrency", 1)): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        base = previous.get((result["orders"], result["mode"], result["concurrency"]))
+        if base is None:
+            continue
+        label = f"{result['mode']} @ {result['orders']:,} orders"
+        for kind, stats in result["operations"].items():
+            before = base["operations"].get(kind, {}).get("p95_ms")
+            if before and stats["p95_ms"] > before * (1 + tolerance):
+                regressions.append(f"{label}: {kind} p95 {before} ms -> {stats['p95_ms']} ms")
+        before = base["overall"]["throughput_ops"]
+        after = result["overall"]["throughput_ops"]
+        if before and after < before * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before} -> {after} ops/s")
+    return regressions
+
+
+def report(results: list[dict[str, Any]]) -> None:
+    for result in results:
+        overall = result["overall"]
+        print(
+            f"\n{result['mode']} @ {result['orders']:,} orders: {overall['throughput_ops']} ops/s, "
+            f"{overall['errors']} errors, peak RSS {result['peak_rss_mb']}"
+        )
+        print(f"  {'operation':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for kind, stats in result["operations"].items():
+            print(f"  {kind:<22}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the query_data tool path against generated databases")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="purchase_orders rows per database")
+    parser.add_argument("--modes", nargs="+", choices=["direct", "stdio"], default=["direct", "stdio"])
+    parser.add_argument("--iterations", type=int, default=200, help="rounds of the workload mix per run")
+    parser.add_argument("--warmup", type=int, default=20, help="statements run before timing starts")
+    parser.add_argument("--concurrency", type=int, default=1, help="statements in flight at once")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json", help="where to write this run's results")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression is reported")
+    parser.add_argument("--worker", choices=["direct", "stdio"], help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    results = [run_case(orders, mode, args) for orders in args.sizes for mode in args.modes]
+    report(results)
+    document = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(document, indent=1))
+    print(f"\nResults written to {args.output}")
+
+    baseline = Path(args.baseline)
+    if args.save_baseline:
+        shutil.copyfile(args.output, baseline)
+        print(f"Saved as baseline {baseline}")
+    elif baseline.exists():
+        regressions = compare(results, json.loads(baseline.read_text()), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions against {baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"✅ No regressions against {baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
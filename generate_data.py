@@ -0,0 +1,274 @@
+import sys
+import math
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterator
+from loguru import logger
+
+# Same tables as the shipped database.db
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    email TEXT,
+    phone_number TEXT,
+    address TEXT
+);
+CREATE TABLE purchase_orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    sku_name TEXT,
+    sku_description TEXT,
+    sku_price REAL,
+    record_date TEXT,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+CREATE TABLE food_beverage_skus (
+    sku_name TEXT PRIMARY KEY,
+    sku_description TEXT,
+    sku_price REAL,
+    sku_category TEXT
+);
+CREATE TABLE inventory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sku_name TEXT NOT NULL,
+    sku_description TEXT NOT NULL,
+    sku_category TEXT NOT NULL,
+    on_hand_quantity INTEGER NOT NULL,
+    unit_price REAL NOT NULL,
+    inventory_value REAL NOT NULL, -- on_hand_quantity * unit_price
+    min_stock_level INTEGER NOT NULL,
+    max_stock_level INTEGER NOT NULL,
+    reorder_point INTEGER NOT NULL,
+    location TEXT,
+    timestamp TEXT NOT NULL,
+    FOREIGN KEY (sku_name) REFERENCES food_beverage_skus(sku_name)
+);
+"""
+
+# Category -> (SKU prefix, price range, products, variants, sizes, storage locations)
+CATEGORIES: dict[str, tuple[str, tuple[float, float], list[str], list[str], list[str], list[str]]] = {
+    "Beverages": ("BEV", (2.29, 12.99), ["Green Tea", "Cold Brew Coffee", "Sparkling Water", "Orange Juice", "Almond Milk", "Kombucha", "Lemonade", "Iced Tea"], ["Organic", "Unsweetened", "Lemon", "Original", "Ginger", "Berry"], ["20 bags", "32 oz", "8-pack", "64 oz", "12 oz"], ["Warehouse A", "Warehouse B"]),
+    "Snacks": ("SNK", (2.79, 18.99), ["Trail Mix", "Potato Chips", "Pretzels", "Granola Bars", "Popcorn", "Mixed Nuts", "Rice Cakes"], ["Deluxe", "Sea Salt", "Honey Roasted", "BBQ", "Lightly Salted"], ["6 oz", "16 oz", "12-pack", "24 oz"], ["Warehouse C", "Warehouse D"]),
+    "Breakfast": ("BRK", (2.79, 8.99), ["Waffle Mix", "Oatmeal", "Granola", "Pancake Syrup", "Corn Flakes", "Muesli"], ["Belgian Style", "Steel Cut", "Maple", "Honey Almond", "Whole Grain"], ["12 oz", "24 oz", "32 oz", "18 oz"], ["Warehouse A", "Warehouse C"]),
+    "Canned Goods": ("CAN", (0.99, 3.49), ["Black Beans", "Diced Tomatoes", "Chicken Soup", "Sweet Corn", "Tuna", "Chickpeas"], ["Low Sodium", "Organic", "In Water", "Fire Roasted", "Classic"], ["15 oz", "14.5 oz", "5 oz", "28 oz"], ["Warehouse B", "Warehouse D"]),
+    "Condiments": ("CON", (2.49, 7.99), ["Ketchup", "Yellow Mustard", "Mayonnaise", "Hot Sauce", "Soy Sauce", "Salsa"], ["Organic", "Spicy", "Reduced Sugar", "Classic", "Chipotle"], ["12 oz", "20 oz", "5 oz", "16 oz"], ["Warehouse A", "Warehouse B"]),
+    "Dairy": ("DRY", (2.99, 5.49), ["Greek Yogurt", "Cheddar Cheese", "Butter", "Oat Milk", "Cottage Cheese", "String Cheese"], ["Plain", "Sharp", "Unsalted", "Original", "2% Milkfat", "Mozzarella"], ["8 oz", "16 oz", "32 oz", "12-pack"], ["Cold Storage A", "Cold Storage B"]),
+    "Frozen Foods": ("FRZ", (2.49, 5.99), ["Pizza", "Mixed Vegetables", "Ice Cream", "Chicken Nuggets", "Waffles", "Burritos"], ["Margherita", "Steam-in-Bag", "Vanilla Bean", "Breaded", "Homestyle"], ["12 oz", "16 oz", "24 oz", "10-pack"], ["Freezer Unit", "Cold Storage B"]),
+    "Baking": ("BAK", (0.99, 5.99), ["All-Purpose Flour", "Baking Soda", "Brown Sugar", "Cocoa Powder", "Vanilla Extract", "Yeast"], ["Unbleached", "Pure", "Light", "Unsweetened", "Active Dry"], ["5 lb", "16 oz", "2 lb", "8 oz", "3-pack"], ["Bakery Section", "Warehouse C"]),
+}
+
+FIRST_NAMES = ["John", "Jane", "Michael", "Emily", "David", "Sarah", "Robert", "Lisa", "James", "Maria", "William", "Linda", "Daniel", "Karen", "Thomas", "Nancy", "Ahmed", "Priya", "Wei", "Sofia"]
+LAST_NAMES = ["Doe", "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Martinez", "Lopez", "Wilson", "Anderson", "Taylor", "Khan", "Patel", "Chen", "Rossi"]
+STREETS = ["Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Elm St", "Cherry Ln", "Birch Ave", "Cedar Blvd", "Walnut Way", "Spruce Ct"]
+TOWNS = ["Anytown", "Somewhere", "Elsewhere", "Cityville", "Townsburg", "Villageton", "Hamletville", "Boroughtown"]
+
+BATCH_ROWS = 50_000
+
+
+def _cumulative(weights: list[float]) -> list[float]:
+    return list(itertools.accumulate(weights))
+
+
+def user_weights(rng: random.Random, users: int) -> list[float]:
+    """Purchase propensity per user: lognormal, so a small share of users places most orders"""
+    return [rng.lognormvariate(0, 1.2) for _ in range(users)]
+
+
+def sku_weights(skus: int, exponent: float) -> list[float]:
+    """Zipfian popularity by rank; rank order is shuffled separately so it isn't tied to SKU numbering"""
+    return [1 / (rank ** exponent) for rank in range(1, skus + 1)]
+
+
+def day_weights(start: date, days: int) -> list[float]:
+    """Order volume per day: yearly season peaking in December, busier weekends and steady growth"""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        season = 1 + 0.35 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 350) / 365.25)
+        weekend = 1.25 if day.weekday() >= 5 else 1.0
+        holiday = 1.6 if (day.month == 11 and day.day >= 24) or (day.month == 12 and day.day <= 24) else 1.0
+        growth = 1 + 0.5 * offset / max(days, 1)
+        weights.append(season * weekend * holiday * growth)
+    return weights
+
+
+def generate_skus(rng: random.Random, count: int) -> list[tuple[str, str, float, str]]:
+    """(sku_name, sku_description, sku_price, sku_category), spread across categories like the shipped catalog"""
+    names = list(CATEGORIES)
+    skus = []
+    for i in range(count):
+        category = names[i % len(names)]
+        prefix, (low, high), products, variants, sizes, _ = CATEGORIES[category]
+        number = i // len(names) + 1
+        description = f"{rng.choice(products)}, {rng.choice(variants)}, {rng.choice(sizes)}"
+        price = round(rng.uniform(low, high), 2)
+        skus.append((f"{prefix}{number:03d}", description, price, category))
+    return skus
+
+
+def generate_users(rng: random.Random, count: int) -> Iterator[tuple[str, str, str, str]]:
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield (
+            f"{first} {last}",
+            f"{first.lower()}.{last.lower()}{i}@example.com",
+            f"555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}",
+            f"{rng.randrange(1, 9999)} {rng.choice(STREETS)}, {rng.choice(TOWNS)}, USA",
+        )
+
+
+def generate_inventory(
+    rng: random.Random, skus: list[tuple[str, str, float, str]], stocked_at: datetime
+) -> Iterator[tuple[Any, ...]]:
+    """One row per SKU and storage location of its category"""
+    timestamp = stocked_at.strftime("%Y-%m-%d %H:%M:%S")
+    for sku_name, description, price, category in skus:
+        for location in CATEGORIES[category][5]:
+            min_stock = rng.randrange(10, 100)
+            max_stock = min_stock * rng.randrange(3, 6)
+            on_hand = rng.randrange(0, max_stock + 1)
+            unit_price = round(price * rng.uniform(0.55, 0.75), 2)
+            yield (
+                sku_name, description, category, on_hand, unit_price, round(on_hand * unit_price, 2),
+                min_stock, max_stock, min_stock + (max_stock - min_stock) // 4, location, timestamp,
+            )
+
+
+def generate_orders(
+    rng: random.Random,
+    count: int,
+    users: int,
+    skus: list[tuple[str, str, float, str]],
+    start: date,
+    days: int,
+    zipf_exponent: float,
+) -> Iterator[list[tuple[Any, ...]]]:
+    """Batches of purchase_orders rows in date order, like an append-only order log"""
+    user_cum = _cumulative(user_weights(rng, users))
+    ranked = skus[:]
+    rng.shuffle(ranked)
+    sku_cum = _cumulative(sku_weights(len(ranked), zipf_exponent))
+    # Orders per day in proportion to the day's weight, rounded so the days add up to exactly `count`
+    day_cum = _cumulative(day_weights(start, days))
+    bounds = [0] + [round(c * count / day_cum[-1]) for c in day_cum]
+    record_dates = itertools.chain.from_iterable(
+        itertools.repeat((start + timedelta(days=d)).isoformat(), bounds[d + 1] - bounds[d]) for d in range(days)
+    )
+    user_ids = range(1, users + 1)
+    remaining = count
+    while remaining:
+        n = min(BATCH_ROWS, remaining)
+        remaining -= n
+        buyers = rng.choices(user_ids, cum_weights=user_cum, k=n)
+        products = rng.choices(ranked, cum_weights=sku_cum, k=n)
+        yield [
+            (user_id, sku[0], sku[1], sku[2], record_date)
+            for user_id, sku, record_date in zip(buyers, products, itertools.islice(record_dates, n))
+        ]
+
+
+def generate(
+    path: str | Path,
+    orders: int,
+    seed: int = 42,
+    users: int | None = None,
+    skus: int | None = None,
+    start: date = date(2023, 1, 1),
+    days: int = 3 * 365,
+    zipf_exponent: float = 1.1,
+    overwrite: bool = False,
+) -> dict[str, int]:
+    """Writes a new database with the shipped schema at the requested scale; the same seed gives the same file"""
+    path = Path(path)
+    if path.exists():
+        if not overwrite:
+            raise FileExistsError(f"{path} already exists")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+    users = users or max(29, orders // 10)
+    skus = skus or min(max(95, orders // 1000), 100_000)
+
+    conn = sqlite3.connect(path)
+    # Bulk-load settings: nothing to roll back to in a brand-new file, so no journal and no fsyncs
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.executescript(SCHEMA)
+
+    # Independent streams per table, so changing one table's size doesn't reshuffle the others
+    rngs = {name: random.Random(f"{seed}:{name}") for name in ("skus", "users", "inventory", "orders")}
+    counts: dict[str, int] = {}
+    started = time.perf_counter()
+    with conn:
+        catalog = generate_skus(rngs["skus"], skus)
+        conn.executemany("INSERT INTO food_beverage_skus VALUES (?, ?, ?, ?)", catalog)
+        counts["food_beverage_skus"] = len(catalog)
+
+        conn.executemany(
+            "INSERT INTO users (name, email, phone_number, address) VALUES (?, ?, ?, ?)",
+            generate_users(rngs["users"], users),
+        )
+        counts["users"] = users
+
+        stocked_at = datetime.combine(start + timedelta(days=days - 1), datetime.min.time()).replace(hour=15)
+        conn.executemany(
+            "INSERT INTO inventory (sku_name, sku_description, sku_category, on_hand_quantity, unit_price, "
+            "inventory_value, min_stock_level, max_stock_level, reorder_point, location, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            generate_inventory(rngs["inventory"], catalog, stocked_at),
+        )
+        counts["inventory"] = conn.execute("SELECT COUNT(*) FROM inventory").fetchone()[0]
+
+        written = 0
+        for batch in generate_orders(rngs["orders"], orders, users, catalog, start, days, zipf_exponent):
+            conn.executemany(
+                "INSERT INTO purchase_orders (user_id, sku_name, sku_description, sku_price, record_date) "
+                "VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+            written += len(batch)
+            if written % (BATCH_ROWS * 20) == 0:
+                elapsed = time.perf_counter() - started
+                logger.info(f"{written:,}/{orders:,} purchase orders ({written / elapsed:,.0f} rows/sec)")
+        counts["purchase_orders"] = written
+
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA locking_mode=NORMAL")
+    # The server expects WAL; switching needs the exclusive lock released first
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    logger.info(f"Wrote {total:,} rows to {path} in {elapsed:.1f}s ({total / elapsed:,.0f} rows/sec)")
+    return counts
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a scaled copy of the demo database with realistic skew")
+    parser.add_argument("path", help="database file to create")
+    parser.add_argument("--orders", type=int, default=100_000, help="purchase_orders rows (default 100000)")
+    parser.add_argument("--users", type=int, help="users rows (default orders / 10)")
+    parser.add_argument("--skus", type=int, help="food_beverage_skus rows (default orders / 1000, at least 95)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed; the same seed writes the same data")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2023, 1, 1), help="first record_date")
+    parser.add_argument("--days", type=int, default=3 * 365, help="number of days of orders")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of SKU popularity")
+    parser.add_argument("--force", action="store_true", help="overwrite an existing file")
+    args = parser.parse_args(argv)
+    try:
+        generate(
+            args.path, args.orders, args.seed, args.users, args.skus, args.start, args.days, args.zipf, args.force
+        )
+    except FileExistsError as e:
+        sys.exit(f"❌ {e} (pass --force to overwrite)")
+
+
+if __name__ == "__main__":
+    main()
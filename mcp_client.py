@@ -87,6 +87,18 @@ class SQLiteAssistantApp:
 
         return model, max_tokens
 
+    def parse_columnar_result(self, result_text):
+        # query_data(output_format="columnar") returns column-major JSON that maps straight onto a DataFrame
+        try:
+            payload = json.loads(result_text)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict) or "columns" not in payload or "data" not in payload:
+            return None
+        frame = pd.DataFrame(dict(enumerate(payload["data"])))
+        frame.columns = payload["columns"]
+        return frame
+
     async def generate_visualizations(self, model):
         print('inside function: generate visualization')
         result_text = st.session_state.last_query_result
@@ -175,7 +187,7 @@ class SQLiteAssistantApp:
 
             system_prompt = textwrap.dedent("""\
                 You are a master SQLite assistant. 
-                Before executing any query, first verify the table names and structure. 
+                Before executing any query, first verify the table names and structure with the describe_schema tool. 
                 If tables are missing, explain why the query cannot be executed. 
                 Your job is to use the tools at your disposal to execute SQL queries and provide the results to the user.
             """)
@@ -236,7 +248,11 @@ class SQLiteAssistantApp:
                                 st.warning("Failed to retrieve SQL query.")
                                 st.write("Raw tool input:", tool_use.input)
 
-                        st.code(result_text)
+                        result_frame = self.parse_columnar_result(result_text)
+                        if result_frame is not None:
+                            st.dataframe(result_frame, use_container_width=True)
+                        else:
+                            st.code(result_text)
 
                         tool_result = {
                             "type": "tool_result",
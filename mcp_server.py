@@ -1,7 +1,30 @@
+import io
+import os
+import argparse
+import csv
+import json
+import re
 import sys
+import time
+import queue
+import random
+import secrets
 import sqlite3
+import tempfile
+import threading
+import itertools
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterator, Literal, TypeVar
 from loguru import logger
+from pydantic import BaseModel
 from mcp.server.fastmcp import FastMCP
+from sketches import KLL, HyperLogLog, SpaceSaving
 
 # Redirect all logs to stderr so stdout is reserved for MCP protocol
 logger.remove()
@@ -10,29 +33,3618 @@ logger.add(sys.stderr)
 # Optional: log a startup message (stderr is safe)
 print("Starting MCP server...", file=sys.stderr)
 
+# Database location and reader pool size, overridable from the environment
+DB_PATH = os.environ.get("SQLITE_DB_PATH", "database.db")
+POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "4"))
+
+# Rows returned per page and how long an unread result cursor is kept open
+PAGE_ROWS = int(os.environ.get("SQLITE_PAGE_ROWS", "100"))
+CURSOR_IDLE_SECONDS = float(os.environ.get("SQLITE_CURSOR_IDLE_SECONDS", "300"))
+
+# Byte budget for cached read results (0 disables the cache) and how often external writes are checked for
+CACHE_BYTES = int(os.environ.get("SQLITE_CACHE_BYTES", str(32 * 1024 * 1024)))
+CACHE_RECHECK_SECONDS = float(os.environ.get("SQLITE_CACHE_RECHECK_SECONDS", "1"))
+
+# Worker threads that execute SQL off the event loop
+WORKERS = int(os.environ.get("SQLITE_WORKERS", str(POOL_SIZE)))
+
+# Default per-call time budget (0 disables it) and how many VM instructions run between deadline checks
+QUERY_TIMEOUT_MS = int(os.environ.get("SQLITE_QUERY_TIMEOUT_MS", "30000"))
+PROGRESS_STEPS = 1000
+
+# Background ANALYZE: check interval (0 disables), rows sampled per index, and row count drift that triggers it
+ANALYZE_INTERVAL_SECONDS = float(os.environ.get("SQLITE_ANALYZE_INTERVAL_SECONDS", "300"))
+ANALYSIS_LIMIT = int(os.environ.get("SQLITE_ANALYSIS_LIMIT", "1000"))
+ANALYZE_DRIFT = float(os.environ.get("SQLITE_ANALYZE_DRIFT", "0.1"))
+
+# Slow query log: threshold (0 disables it), JSONL file, and size at which it rotates into numbered backups
+SLOW_QUERY_MS = float(os.environ.get("SQLITE_SLOW_QUERY_MS", "1000"))
+SLOW_LOG_PATH = os.environ.get("SQLITE_SLOW_LOG_PATH", "slow_queries.jsonl")
+SLOW_LOG_MAX_BYTES = int(os.environ.get("SQLITE_SLOW_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_LOG_BACKUPS = int(os.environ.get("SQLITE_SLOW_LOG_BACKUPS", "3"))
+
+# Optional Prometheus text output of query metrics: a file rewritten every interval and/or a localhost /metrics port
+METRICS_FILE = os.environ.get("SQLITE_METRICS_FILE")
+METRICS_PORT = int(os.environ.get("SQLITE_METRICS_PORT", "0"))
+METRICS_INTERVAL_SECONDS = float(os.environ.get("SQLITE_METRICS_INTERVAL_SECONDS", "15"))
+
+# Extra databases served by identifier: a JSON file mapping identifiers to paths and/or a directory of <identifier>.db files
+DATABASE_REGISTRY = os.environ.get("SQLITE_DATABASE_REGISTRY")
+DATABASE_DIR = os.environ.get("SQLITE_DATABASE_DIR")
+DEFAULT_DATABASE = "default"
+
+# Budgets for databases kept open at once; beyond them the least recently used idle database is closed
+MAX_OPEN_DATABASES = int(os.environ.get("SQLITE_MAX_OPEN_DATABASES", "64"))
+OPEN_FD_BUDGET = int(os.environ.get("SQLITE_OPEN_FD_BUDGET", "512"))
+OPEN_MEMORY_BUDGET = int(os.environ.get("SQLITE_OPEN_MEMORY_BUDGET", str(1024 * 1024 * 1024)))
+
+# Snapshot copies for reads that accept stale data: refreshed at most this often while read, 0 disables them
+SNAPSHOT_REFRESH_SECONDS = float(os.environ.get("SQLITE_SNAPSHOT_REFRESH_SECONDS", "60"))
+# Where snapshot files are written; defaults to a .snapshots directory next to the database they copy
+SNAPSHOT_DIR = os.environ.get("SQLITE_SNAPSHOT_DIR")
+
+# Per-connection pragmas by profile name; "default" keeps SQLite's built-in settings
+PROFILES: dict[str, dict[str, int | str]] = {
+    "default": {},
+    # Large page cache, reads served from memory-mapped pages shared by all readers, sorts in memory
+    "read_heavy": {"cache_size": -65536, "mmap_size": 1 << 30, "temp_store": "MEMORY", "synchronous": "NORMAL"},
+    # Never fsyncs, not even at checkpoints. Survives the server process crashing, but an OS crash or power loss can
+    # corrupt the database file, WAL or not: only for loads that can be redone from their source
+    "bulk_load": {"cache_size": -262144, "mmap_size": 1 << 28, "temp_store": "MEMORY", "synchronous": "OFF"},
+    # Every commit is synced to disk before it returns
+    "durable": {"cache_size": -16384, "mmap_size": 0, "temp_store": "FILE", "synchronous": "FULL"},
+}
+PROFILE = os.environ.get("SQLITE_PROFILE", "default")
+if PROFILE not in PROFILES:
+    raise ValueError(f"Unknown SQLITE_PROFILE {PROFILE!r}, expected one of {', '.join(PROFILES)}")
+
+# How result pages are rendered for the client
+OutputFormat = Literal["text", "columnar", "csv", "tsv"]
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: dict[str, int | str]) -> None:
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}")
+
+
+class ConnectionPool:
+    """A fixed-size pool of long-lived SQLite connections"""
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 4,
+        readonly: bool = False,
+        pragmas: dict[str, int | str] | None = None,
+        immutable: bool = False,
+    ):
+        self.path = path
+        self.size = max(1, size)
+        self.readonly = readonly or immutable
+        # Immutable files are opened without any locking; only for files nothing writes to
+        self.immutable = immutable
+        self.pragmas = pragmas or {}
+        # LIFO so the most recently used (warmest page cache) connection is handed out first
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            uri = f"{Path(self.path).resolve().as_uri()}?mode=ro"
+            if self.immutable:
+                uri += "&immutable=1"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def _healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _reset(self, conn: sqlite3.Connection) -> None:
+        # Don't leak an open transaction or per-call settings into the next user
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        conn.set_progress_handler(None, 0)
+
+    def acquire(self, timeout: float | None = None) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    try:
+                        return self._connect()
+                    except Exception:
+                        self._created -= 1
+                        raise
+            try:
+                conn = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"no database connection available after {timeout}s")
+
+        if not self._healthy(conn):
+            logger.warning("Replacing unhealthy pooled connection")
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            conn = self._connect()
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if self._closed:
+            conn.close()
+            return
+        try:
+            self._reset(conn)
+        except sqlite3.Error:
+            # A connection we can't reset is discarded; a fresh one is opened on demand
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self, timeout: float | None = None) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Database:
+    """A WAL-mode database with a single writer connection and a pool of read-only readers"""
+
+    def __init__(self, path: str, readers: int = 4, profile: str = "default"):
+        self.path = path
+        self.profile = profile
+        # Paginated results pin a reader each, so there is always more than one
+        self.readers = ConnectionPool(path, max(2, readers), readonly=True, pragmas=PROFILES[profile])
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._probe: sqlite3.Connection | None = None
+        self._probe_lock = threading.Lock()
+        # Bumped whenever the writer is used, so in-process writes are seen without asking SQLite
+        self.write_generation = 0
+
+    def _ensure_writer(self) -> sqlite3.Connection:
+        # The writer is opened first so WAL is enabled before any reader attaches
+        if self._writer is None:
+            with self._open_lock:
+                if self._writer is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+                    if mode != "wal":
+                        logger.warning(f"Could not enable WAL on {self.path}, journal mode is {mode}")
+                    apply_pragmas(conn, PROFILES[self.profile])
+                    self._writer = conn
+        return self._writer
+
+    def open_connections(self) -> int:
+        return self.readers._created + (self._writer is not None) + (self._probe is not None)
+
+    def acquire_reader(self, timeout: float | None = None) -> sqlite3.Connection:
+        self._ensure_writer()
+        return self.readers.acquire(timeout)
+
+    def release_reader(self, conn: sqlite3.Connection) -> None:
+        self.readers.release(conn)
+
+    @contextmanager
+    def reader(self, timeout: float | None = None) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire_reader(timeout)
+        try:
+            yield conn
+        finally:
+            self.release_reader(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        conn = self._ensure_writer()
+        with self._writer_lock:
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self.write_generation += 1
+
+    def versions(self) -> tuple[int, int]:
+        """Returns (PRAGMA data_version, PRAGMA schema_version) as seen by a dedicated probe connection"""
+        self._ensure_writer()
+        with self._probe_lock:
+            if self._probe is None:
+                self._probe = self.readers._connect()
+            data_version = self._probe.execute("PRAGMA data_version").fetchone()[0]
+            schema_version = self._probe.execute("PRAGMA schema_version").fetchone()[0]
+        return data_version, schema_version
+
+    def close(self) -> None:
+        self.readers.close()
+        with self._probe_lock:
+            if self._probe is not None:
+                self._probe.close()
+                self._probe = None
+        with self._writer_lock:
+            if self._writer is not None:
+                # Lets SQLite refresh statistics it noticed were missing or stale while we ran
+                try:
+                    self._writer.execute("PRAGMA optimize")
+                except sqlite3.Error as e:
+                    logger.warning(f"PRAGMA optimize failed on close: {e}")
+                self._writer.close()
+                self._writer = None
+
+    def backup(self, path: str) -> None:
+        """Copies the database to `path` with the backup API as a standalone (non-WAL) file"""
+        self._ensure_writer()
+        source = self.readers._connect()
+        try:
+            target = sqlite3.connect(path)
+            try:
+                # One step copies everything inside a single read transaction: a consistent copy that,
+                # in WAL mode, never blocks the writer
+                source.backup(target)
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+
+_SNAPSHOT_SUFFIX = ".snapshot"
+# Stems of snapshot files: <stem>.snapshot-<random> (older versions) or <stem>.<pid>.<random>.snapshot
+_SNAPSHOT_NAME_RE = re.compile(r"\.snapshot(-\w+)?$")
+
+
+def _process_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Snapshot:
+    """A point-in-time copy of a database, read through immutable connections that take no locks"""
+
+    def __init__(self, path: str, taken_at: float, readers: int, pragmas: dict[str, int | str]):
+        self.path = path
+        self.taken_at = taken_at
+        self.readers = ConnectionPool(path, readers, pragmas=pragmas, immutable=True)
+        self.users = 0
+        self.retired = False
+        self._lock = threading.Lock()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.taken_at
+
+    def acquire_reader(self, timeout: float | None = None) -> sqlite3.Connection | None:
+        """Borrows a connection, or returns None once a newer snapshot has replaced this one"""
+        with self._lock:
+            if self.retired:
+                return None
+            self.users += 1
+        try:
+            return self.readers.acquire(timeout)
+        except BaseException:
+            self._unpin()
+            raise
+
+    def release_reader(self, conn: sqlite3.Connection) -> None:
+        self.readers.release(conn)
+        self._unpin()
+
+    def _unpin(self) -> None:
+        with self._lock:
+            self.users -= 1
+            discard = self.retired and self.users == 0
+        if discard:
+            self._discard()
+
+    def retire(self) -> None:
+        """Deletes the copy as soon as the last reader (or open cursor) on it is released"""
+        with self._lock:
+            self.retired = True
+            discard = self.users == 0
+        if discard:
+            self._discard()
+
+    def _discard(self) -> None:
+        self.readers.close()
+        Path(self.path).unlink(missing_ok=True)
+
+
+class SnapshotReplicas:
+    """Keeps a periodically refreshed copy of a database made with the backup API, for reads that tolerate staleness.
+
+    Copies are only made while reads ask for them. A refresh writes a new file and swaps it in; the previous copy
+    stays readable until its last reader is done, so a long aggregation never waits for a refresh or on the primary.
+    """
+
+    def __init__(self, database: Database, interval: float, directory: str | None, readers: int):
+        self.database = database
+        self.interval = interval
+        # Kept apart from the databases themselves (and not named *.db) so a snapshot is never served as a database
+        self.directory = Path(directory).expanduser() if directory else Path(database.path).resolve().parent / ".snapshots"
+        # <stem>.<pid>.<random>.snapshot, so leftovers of a crashed server can be told from another server's live copies
+        self.prefix = f"{Path(database.path).stem}.{os.getpid()}."
+        self.readers = readers
+        self.refreshes = 0
+        self.last_refresh_seconds: float | None = None
+        self._current: Snapshot | None = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def refresh(self) -> Snapshot:
+        with self._refresh_lock:
+            started = time.perf_counter()
+            taken_at = time.time()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix=self.prefix, suffix=_SNAPSHOT_SUFFIX, dir=self.directory)
+            os.close(fd)
+            try:
+                self.database.backup(path)
+            except BaseException:
+                Path(path).unlink(missing_ok=True)
+                raise
+            snapshot = Snapshot(path, taken_at, self.readers, PROFILES[self.database.profile])
+            with self._lock:
+                previous, self._current = self._current, snapshot
+            if previous is not None:
+                previous.retire()
+            self.refreshes += 1
+            self.last_refresh_seconds = time.perf_counter() - started
+            logger.info(f"Refreshed snapshot of {self.database.path} in {self.last_refresh_seconds:.2f}s")
+            return snapshot
+
+    def acquire(self, max_staleness: float) -> tuple[Snapshot, sqlite3.Connection] | None:
+        """A connection on a snapshot at most `max_staleness` seconds old, or None if there is no such snapshot"""
+        if self.interval <= 0:
+            return None
+        # Any read asking for a snapshot keeps the copy refreshed
+        self._wanted.set()
+        with self._lock:
+            snapshot = self._current
+        if snapshot is None or snapshot.age > max_staleness:
+            return None
+        conn = snapshot.acquire_reader()
+        return (snapshot, conn) if conn is not None else None
+
+    def age(self) -> float | None:
+        with self._lock:
+            return self._current.age if self._current is not None else None
+
+    def open_connections(self) -> int:
+        with self._lock:
+            return self._current.readers._created if self._current is not None else 0
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # Idle databases are not copied: wait until a read asks for a snapshot
+            self._wanted.wait()
+            if self._stop.is_set():
+                break
+            self._wanted.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Snapshot refresh of {self.database.path} failed: {e}")
+            self._stop.wait(self.interval)
+
+    def remove_stale(self) -> None:
+        """Deletes snapshots of this database left behind by servers that are no longer running"""
+        stem = Path(self.database.path).stem
+        # mkstemp's random part has no dots, so another database's "<stem>.x" snapshots never match
+        pattern = re.compile(re.escape(stem) + r"\.(\d+)\.\w+" + re.escape(_SNAPSHOT_SUFFIX))
+        stale = [
+            p for p in self.directory.glob(f"{stem}.*{_SNAPSHOT_SUFFIX}")
+            if (match := pattern.fullmatch(p.name)) and not _process_running(int(match.group(1)))
+        ]
+        # Older versions wrote <stem>.snapshot-<random>.db next to the database
+        stale += Path(self.database.path).resolve().parent.glob(f"{stem}.snapshot-*.db")
+        for path in stale:
+            path.unlink(missing_ok=True)
+        if stale:
+            logger.info(f"Removed {len(stale)} stale snapshots of {self.database.path}")
+
+    def start(self) -> None:
+        if self.interval > 0 and self._thread is None:
+            self.remove_stale()
+            self._thread = threading.Thread(target=self._loop, name="sqlite-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wanted.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            current, self._current = self._current, None
+        if current is not None:
+            current.retire()
+
+
+# Statements that never modify the database and can run on a read-only connection
+_READ_KEYWORDS = {"SELECT", "WITH", "EXPLAIN", "VALUES"}
+
+
+def _strip_leading_comments(sql: str) -> str:
+    sql = sql.lstrip()
+    while True:
+        if sql.startswith("--"):
+            sql = sql.split("\n", 1)[1].lstrip() if "\n" in sql else ""
+        elif sql.startswith("/*"):
+            end = sql.find("*/")
+            sql = sql[end + 2:].lstrip() if end != -1 else ""
+        else:
+            return sql
+
+
+def is_read_statement(sql: str) -> bool:
+    """Best-effort check for whether a statement only reads from the database"""
+    body = _strip_leading_comments(sql).lstrip("(")
+    keyword = body.split(None, 1)[0].upper() if body else ""
+    if keyword in _READ_KEYWORDS:
+        return True
+    # Plain PRAGMA queries (table_info, index_list, ...) read; assignments write
+    return keyword == "PRAGMA" and "=" not in body
+
+
+def _is_readonly_error(e: sqlite3.Error) -> bool:
+    return getattr(e, "sqlite_errorname", "") == "SQLITE_READONLY" or "readonly" in str(e)
+
+
+_SQL_TOKEN_RE = re.compile(
+    r"""('(?:[^']|'')*')"""  # string literal
+    r"""|("(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])"""  # quoted identifier
+    r"""|(--[^\n]*|/\*.*?(?:\*/|$))"""  # comment
+    r"""|(\s+)""",
+    re.S,
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """Canonical form of a statement: comments dropped, whitespace collapsed, case folded outside quotes"""
+    parts = []
+    pos = 0
+    for match in _SQL_TOKEN_RE.finditer(sql):
+        parts.append(sql[pos:match.start()].lower())
+        if match.group(1) or match.group(2):
+            parts.append(match.group(0))
+        else:
+            parts.append(" ")
+        pos = match.end()
+    parts.append(sql[pos:].lower())
+    return re.sub(r"\s+", " ", "".join(parts)).strip().rstrip(";").strip()
+
+
+# Numeric literals not part of an identifier, and parameter lists left after literals are replaced
+_NUMBER_RE = re.compile(r"(?<![\w.])(?:0x[0-9a-f]+|\d+\.?\d*(?:e[+-]?\d+)?|\.\d+(?:e[+-]?\d+)?)(?![\w.])")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def fingerprint_sql(sql: str) -> tuple[str, list[Any]]:
+    """normalize_sql with string and number literals replaced by ?, and the literals that were replaced"""
+    literals: list[Any] = []
+
+    def number(match: re.Match) -> str:
+        text = match.group(0)
+        literals.append(int(text, 16) if text.startswith("0x") else float(text) if any(c in text for c in ".e") else int(text))
+        return "?"
+
+    parts = []
+    pos = 0
+    for match in _SQL_TOKEN_RE.finditer(sql):
+        parts.append(_NUMBER_RE.sub(number, sql[pos:match.start()].lower()))
+        if match.group(1):
+            literals.append(match.group(1)[1:-1].replace("''", "'"))
+            parts.append("?")
+        elif match.group(2):
+            parts.append(match.group(0))
+        else:
+            parts.append(" ")
+        pos = match.end()
+    parts.append(_NUMBER_RE.sub(number, sql[pos:].lower()))
+    text = re.sub(r"\s+", " ", "".join(parts)).strip().rstrip(";").strip()
+    # IN lists of any length share one fingerprint
+    return _PLACEHOLDER_LIST_RE.sub("(...)", text), literals
+
+
+# Statements whose result can change without the database changing
+_VOLATILE_SQL_RE = re.compile(
+    r"\b(random|randomblob|changes|total_changes|last_insert_rowid)\s*\(|\bcurrent_(date|time|timestamp)\b|'now'"
+)
+
+
+class ResultCache:
+    """Byte-bounded LRU of complete read results, dropped whenever the database changes"""
+
+    def __init__(self, database: Database, max_bytes: int, recheck_seconds: float):
+        self.database = database
+        self.max_bytes = max_bytes
+        self.recheck_seconds = recheck_seconds
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries: OrderedDict[str, tuple[list[tuple], list[str], int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: tuple[int, int, int] | None = None
+        self._checked_at = 0.0
+        self._checked_generation = -1
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def cacheable(self, fingerprint: str) -> bool:
+        return self.enabled and not _VOLATILE_SQL_RE.search(fingerprint)
+
+    def generation(self) -> int:
+        """Validates the cache against the database and returns the write generation it belongs to"""
+        generation = self.database.write_generation
+        now = time.monotonic()
+        # In-process writes are caught by the generation; external ones by data_version, polled at most every recheck_seconds
+        if generation == self._checked_generation and now - self._checked_at < self.recheck_seconds:
+            return generation
+        version = (generation, *self.database.versions())
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self.bytes = 0
+                self._version = version
+            self._checked_at = now
+            self._checked_generation = generation
+        return generation
+
+    def get(self, fingerprint: str, max_rows: int) -> tuple[list[tuple], list[str]] | None:
+        """Looks up a result; callers validate with generation() first"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            # A result longer than the requested page has to be re-run to get a cursor
+            if entry is None or len(entry[0]) > max_rows:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, fingerprint: str, rows: list[tuple], columns: list[str], generation: int) -> None:
+        size = _estimate_size(rows) + sum(len(c) for c in columns)
+        # One entry may not take more than an eighth of the budget
+        if size > self.max_bytes // 8:
+            return
+        with self._lock:
+            # A write landed while this result was being read; it may already be stale
+            if generation != self.database.write_generation:
+                return
+            old = self._entries.pop(fingerprint, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[fingerprint] = (rows, columns, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _estimate_size(rows: list[tuple]) -> int:
+    size = 56 * len(rows)
+    for row in rows:
+        for value in row:
+            size += 16 + (len(value) if isinstance(value, (str, bytes)) else 8)
+    return size
+
+
+class CursorExpiredError(Exception):
+    """Raised when a cursor was closed (by a client or the idle sweep) before its fetch got to it"""
+
+
+class ServerCursor:
+    """An open result set whose remaining rows are fetched page by page"""
+
+    def __init__(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, lookahead: tuple, source: Any = None):
+        self.conn = conn
+        # Whatever lent the connection (the database or one of its snapshots); it gets it back on close
+        self.source = source
+        self.cursor = cursor
+        self.lookahead: tuple | None = lookahead
+        self.rows_sent = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        # Set under lock once the connection is handed back; it may already be serving someone else
+        self.closed = False
+
+    def fetch_page(self, page_rows: int) -> tuple[list[tuple], bool]:
+        """Returns the next page and whether more rows remain"""
+        self.last_used = time.monotonic()
+        rows = [self.lookahead] if self.lookahead is not None else []
+        rows += self.cursor.fetchmany(page_rows + 1 - len(rows))
+        self.lookahead = rows.pop() if len(rows) > page_rows else None
+        self.rows_sent += len(rows)
+        return rows, self.lookahead is not None
+
+
+class CursorRegistry:
+    """Server-held result cursors, closed after an idle timeout"""
+
+    def __init__(self, database: Database, idle_seconds: float, max_open: int):
+        self.database = database
+        self.idle_seconds = idle_seconds
+        # Each open cursor pins a reader connection, so keep at least one reader free
+        self.max_open = max(1, max_open)
+        self._cursors: dict[str, ServerCursor] = {}
+        self._lock = threading.Lock()
+
+    def open(
+        self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, lookahead: tuple, rows_sent: int, source: Any = None
+    ) -> str:
+        self.expire()
+        server_cursor = ServerCursor(conn, cursor, lookahead, source or self.database)
+        server_cursor.rows_sent = rows_sent
+        token = secrets.token_urlsafe(12)
+        with self._lock:
+            evicted = []
+            while len(self._cursors) >= self.max_open:
+                oldest = min(self._cursors, key=lambda t: self._cursors[t].last_used)
+                evicted.append(self._cursors.pop(oldest))
+            self._cursors[token] = server_cursor
+        for stale in evicted:
+            self._release(stale)
+        return token
+
+    def get(self, token: str) -> ServerCursor | None:
+        self.expire()
+        with self._lock:
+            return self._cursors.get(token)
+
+    def close(self, token: str) -> bool:
+        with self._lock:
+            server_cursor = self._cursors.pop(token, None)
+        if server_cursor is None:
+            return False
+        self._release(server_cursor)
+        return True
+
+    def expire(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            stale = [t for t, c in self._cursors.items() if c.last_used < cutoff]
+            expired = [self._cursors.pop(t) for t in stale]
+        for server_cursor in expired:
+            self._release(server_cursor)
+
+    def __len__(self) -> int:
+        self.expire()
+        with self._lock:
+            return len(self._cursors)
+
+    def close_all(self) -> None:
+        with self._lock:
+            open_cursors = list(self._cursors.values())
+            self._cursors.clear()
+        for server_cursor in open_cursors:
+            self._release(server_cursor)
+
+    def _release(self, server_cursor: ServerCursor) -> None:
+        with server_cursor.lock:
+            if server_cursor.closed:
+                return
+            server_cursor.closed = True
+            try:
+                server_cursor.cursor.close()
+            except sqlite3.Error:
+                pass
+            server_cursor.source.release_reader(server_cursor.conn)
+
+
+class SchemaCache:
+    """Introspected schema of the database, rebuilt only when PRAGMA schema_version changes"""
+
+    def __init__(self, database: Database):
+        self.database = database
+        self._schema: dict[str, Any] | None = None
+        self._schema_version: int | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> dict[str, Any]:
+        _, schema_version = self.database.versions()
+        with self._lock:
+            if self._schema is None or schema_version != self._schema_version:
+                with self.database.reader() as conn:
+                    self._schema = introspect_schema(conn)
+                self._schema_version = schema_version
+            return self._schema
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def user_tables(
+    conn: sqlite3.Connection, include_views: bool = False, include_virtual: bool = True
+) -> list[tuple[str, str]]:
+    """(name, type) of tables (and optionally views), leaving out SQLite internals and virtual table shadow tables"""
+    kinds = "('table', 'view')" if include_views else "('table')"
+    objects = conn.execute(
+        f"SELECT name, type, sql FROM sqlite_master WHERE type IN {kinds} AND name NOT LIKE 'sqlite_%' ORDER BY type, name"
+    ).fetchall()
+    # FTS5 and friends store their data in "<name>_<suffix>" tables
+    virtual = [name for name, _, sql in objects if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")]
+    return [
+        (name, kind) for name, kind, _ in objects
+        if not any(name.startswith(f"{v}_") for v in virtual) and (include_virtual or name not in virtual)
+    ]
+
+
+def introspect_schema(conn: sqlite3.Connection) -> dict[str, Any]:
+    """Collects tables and views with their columns, foreign keys and indexes"""
+    objects = user_tables(conn, include_views=True)
+    tables = []
+    for name, kind in objects:
+        quoted = _quote_identifier(name)
+        columns = [
+            {"name": col, "type": col_type, "notnull": bool(notnull), "default": default, "pk": pk}
+            for _, col, col_type, notnull, default, pk in conn.execute(f"PRAGMA table_info({quoted})")
+        ]
+        foreign_keys = [
+            {"column": fk[3], "references": fk[2], "to": fk[4]}
+            for fk in conn.execute(f"PRAGMA foreign_key_list({quoted})")
+        ]
+        indexes = []
+        for _, index_name, unique, origin, _ in conn.execute(f"PRAGMA index_list({quoted})"):
+            index_columns = [info[2] for info in conn.execute(f"PRAGMA index_info({_quote_identifier(index_name)})")]
+            indexes.append({"name": index_name, "unique": bool(unique), "origin": origin, "columns": index_columns})
+        tables.append({"name": name, "type": kind, "columns": columns, "foreign_keys": foreign_keys, "indexes": indexes})
+    return {"tables": tables}
+
+
+def format_schema(schema: dict[str, Any]) -> str:
+    """Renders the schema as one compact block per table for the model"""
+    blocks = []
+    for table in schema["tables"]:
+        columns = []
+        for col in table["columns"]:
+            parts = [col["name"], col["type"] or "ANY"]
+            if col["pk"]:
+                parts.append("PRIMARY KEY")
+            if col["notnull"]:
+                parts.append("NOT NULL")
+            columns.append(" ".join(parts))
+        lines = [f"{table['type'].upper()} {table['name']} ({', '.join(columns)})"]
+        for fk in table["foreign_keys"]:
+            lines.append(f"  FOREIGN KEY {fk['column']} -> {fk['references']}({fk['to'] or 'rowid'})")
+        for index in table["indexes"]:
+            unique = "UNIQUE " if index["unique"] else ""
+            lines.append(f"  {unique}INDEX {index['name']} ({', '.join(c or 'expr' for c in index['columns'])})")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+class QueryBudget:
+    """Time budget for one tool call, enforced from SQLite's progress handler"""
+
+    def __init__(self, timeout_ms: int | None):
+        self.timeout_ms = timeout_ms if timeout_ms and timeout_ms > 0 else None
+        self.started = time.monotonic()
+        self.deadline = self.started + self.timeout_ms / 1000 if self.timeout_ms else None
+        self.steps = 0
+        self.timed_out = False
+        self.cancelled = False
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _check(self) -> int:
+        # Called by SQLite every PROGRESS_STEPS VM instructions; non-zero aborts the statement
+        self.steps += PROGRESS_STEPS
+        if self.cancelled:
+            return 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.timed_out = True
+            return 1
+        return 0
+
+    @contextmanager
+    def applied(self, conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        conn.set_progress_handler(self._check, PROGRESS_STEPS)
+        with self._lock:
+            self._conn = conn
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._conn = None
+            conn.set_progress_handler(None, 0)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        with self._lock:
+            # Only interrupt while the connection is still running our statement
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    @property
+    def stopped(self) -> bool:
+        return self.timed_out or self.cancelled
+
+    def describe(self) -> str:
+        elapsed_ms = (time.monotonic() - self.started) * 1000
+        if self.cancelled:
+            return f"❌ Query cancelled after {elapsed_ms:.0f} ms, {self.steps} VM steps"
+        return f"❌ Query timed out after {elapsed_ms:.0f} ms, {self.steps} VM steps (limit {self.timeout_ms} ms)"
+
+
+T = TypeVar("T")
+
+
+class SQLExecutor:
+    """Bounded thread pool for SQL work, with queue depth and wait time metrics"""
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sql")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits: deque[float] = deque(maxlen=1000)
+
+    def _track(self, submitted: float, fn: Callable[..., T], *args: Any) -> T:
+        wait = time.monotonic() - submitted
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent_waits.append(wait)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, budget: QueryBudget, fn: Callable[..., T], *args: Any) -> T:
+        """Runs blocking SQLite work on the pool, interrupting it if the client cancels the request"""
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        future = self._executor.submit(self._track, time.monotonic(), fn, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Still queued: drop it. Already running: stop it from the progress handler.
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            budget.cancel()
+            raise
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            started = self.completed + self.active
+
+            def pct(q: float) -> float:
+                return round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 3) if waits else 0.0
+
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "max_queued": self.max_queued,
+                "wait_ms_avg": round(self.total_wait / started * 1000, 3) if started else 0.0,
+                "wait_ms_p50": pct(0.5),
+                "wait_ms_p95": pct(0.95),
+                "wait_ms_max": round(self.max_wait * 1000, 3),
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Histogram bucket upper bounds: seconds for timings, then row and byte counts
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+BYTE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """Fixed-bucket histogram in the Prometheus style: cumulative counts per upper bound plus count and sum"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-th observation (None past the last bound)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return None
+
+    def cumulative(self) -> Iterator[tuple[str, int]]:
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f"{bound:g}", total
+        yield "+Inf", self.count
+
+
+class QueryTrace:
+    """Timings and sizes of one query_data call, filled in as it runs"""
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+        self.rows = 0
+        self.bytes = 0
+        self.cache_hit = False
+        # Age in seconds of the snapshot the query read, None when it ran on the database itself
+        self.snapshot_age: float | None = None
+        self.error = False
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+class QueryMetrics:
+    """Histograms of query_data phase timings, rows and bytes, rendered as JSON or Prometheus text"""
+
+    PHASES = ("connection_wait", "parse", "exec", "fetch", "serialise", "total")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.snapshot_reads = 0
+        self.timings = {phase: Histogram(LATENCY_BUCKETS) for phase in self.PHASES}
+        self.rows = Histogram(ROW_BUCKETS)
+        self.bytes = Histogram(BYTE_BUCKETS)
+
+    def observe(self, trace: QueryTrace) -> None:
+        with self._lock:
+            self.queries += 1
+            self.errors += trace.error
+            self.cache_hits += trace.cache_hit
+            self.snapshot_reads += trace.snapshot_age is not None
+            for phase, seconds in trace.timings.items():
+                self.timings[phase].observe(seconds)
+            if not trace.error:
+                self.rows.observe(trace.rows)
+                self.bytes.observe(trace.bytes)
+        logger.debug(
+            "query_data "
+            + " ".join(f"{phase}={seconds * 1000:.2f}ms" for phase, seconds in trace.timings.items())
+            + f" rows={trace.rows} bytes={trace.bytes} cache_hit={trace.cache_hit} error={trace.error}"
+        )
+
+    def stats(self) -> dict[str, Any]:
+        def ms(value: float | None) -> float | None:
+            return round(value * 1000, 3) if value is not None else None
+
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "errors": self.errors,
+                "cache_hits": self.cache_hits,
+                "snapshot_reads": self.snapshot_reads,
+                "timings_ms": {
+                    phase: {
+                        "count": h.count,
+                        "avg": ms(h.sum / h.count) if h.count else 0.0,
+                        "p50": ms(h.quantile(0.5)),
+                        "p95": ms(h.quantile(0.95)),
+                        "p99": ms(h.quantile(0.99)),
+                    }
+                    for phase, h in self.timings.items()
+                },
+                "rows": {"total": int(self.rows.sum), "p50": self.rows.quantile(0.5), "p95": self.rows.quantile(0.95)},
+                "bytes": {"total": int(self.bytes.sum), "p50": self.bytes.quantile(0.5), "p95": self.bytes.quantile(0.95)},
+            }
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, h: Histogram, labels: str = "") -> None:
+            for bound, count in h.cumulative():
+                lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {h.sum:g}")
+            lines.append(f"{name}_count{suffix} {h.count}")
+
+        with self._lock:
+            for name, help_text, value in (
+                ("sqlite_mcp_queries_total", "query_data calls", self.queries),
+                ("sqlite_mcp_query_errors_total", "query_data calls that failed", self.errors),
+                ("sqlite_mcp_cache_hits_total", "query_data calls answered from the result cache", self.cache_hits),
+                ("sqlite_mcp_snapshot_reads_total", "query_data calls served from a snapshot copy", self.snapshot_reads),
+            ):
+                header(name, "counter", help_text)
+                lines.append(f"{name} {value}")
+            header("sqlite_mcp_query_seconds", "histogram", "query_data time per phase")
+            for phase, h in self.timings.items():
+                histogram("sqlite_mcp_query_seconds", h, f'phase="{phase}"')
+            header("sqlite_mcp_query_rows", "histogram", "Rows returned by query_data")
+            histogram("sqlite_mcp_query_rows", self.rows)
+            header("sqlite_mcp_query_bytes", "histogram", "Bytes serialised by query_data")
+            histogram("sqlite_mcp_query_bytes", self.bytes)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Publishes QueryMetrics in Prometheus text format to a file (rewritten periodically) and/or an HTTP port"""
+
+    def __init__(self, metrics: QueryMetrics, path: str | None, port: int | None, interval: float):
+        self.metrics = metrics
+        self.path = Path(path) if path else None
+        self.port = port
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._server: ThreadingHTTPServer | None = None
+
+    def write(self) -> None:
+        # Write then rename so a scraper (e.g. node_exporter's textfile collector) never reads a partial file
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(self.metrics.prometheus())
+        os.replace(tmp, self.path)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Writing metrics to {self.path} failed: {e}")
+
+    def start(self) -> None:
+        if self.path is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="sqlite-metrics", daemon=True)
+            self._thread.start()
+        if self.port and self._server is None:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self) -> None:
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = metrics.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format: str, *args: Any) -> None:
+                    # The default handler logs to stderr for every scrape
+                    pass
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, name="sqlite-metrics-http", daemon=True).start()
+            logger.info(f"Serving Prometheus metrics on http://127.0.0.1:{self.port}/metrics")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+            try:
+                self.write()
+            except OSError:
+                pass
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Words that can follow a table name in FROM/JOIN without being its alias
+_NOT_ALIASES = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "limit", "having", "window", "union", "intersect", "except", "set", "values",
+    "indexed", "not", "as", "returning", "default",
+}
+
+
+def _table_aliases(sql: str, tables: set[str]) -> dict[str, str]:
+    """Maps aliases (and bare names) used in a statement back to table names"""
+    aliases = {name: name for name in tables}
+    # Lookahead so "join inventory i" still yields "inventory i" after "join inventory" is tried
+    pattern = re.compile(r'(?=\b("?)(\w+)\1(?:\s+as)?\s+(\w+))', re.I)
+    for match in pattern.finditer(normalize_sql(sql)):
+        table, alias = match.group(2), match.group(3)
+        if table in tables and alias not in _NOT_ALIASES and alias not in tables:
+            aliases[alias] = table
+    return aliases
+
+
+def _plan_statistics(conn: sqlite3.Connection) -> tuple[dict[str, int], dict[str, list[int]]] | None:
+    """Returns table row counts and per-index stat columns from sqlite_stat1, or None without ANALYZE"""
+    table_rows: dict[str, int] = {}
+    index_stats: dict[str, list[int]] = {}
+    try:
+        stat_rows = conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall()
+    except sqlite3.OperationalError:
+        return None
+    for tbl, idx, stat in stat_rows:
+        numbers = [int(n) for n in str(stat).split() if n.isdigit()]
+        if not numbers:
+            continue
+        table_rows[tbl] = max(table_rows.get(tbl, 0), numbers[0])
+        if idx:
+            index_stats[idx] = numbers
+    return table_rows, index_stats
+
+
+def _approximate_rows(conn: sqlite3.Connection, table: str) -> int | None:
+    # MAX(rowid) is a single B-tree seek: a cheap upper bound when there are no statistics
+    try:
+        value = conn.execute(f"SELECT MAX(rowid) FROM {_quote_identifier(table)}").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    return int(value or 0)
+
+
+_PLAN_STEP_RE = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\S+)(?: AS (\S+))?(?: USING (.*?))?(?: \((.*)\))?$")
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: list[Any] | dict[str, Any] | None = None) -> list[dict[str, Any]]:
+    # EXPLAIN reports the plan compiled at prepare time and doesn't notice schema changes made by other connections:
+    # reading sqlite_master reloads the schema, and the version comment keeps a cached statement from being reused
+    conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+    (schema_version,) = conn.execute("PRAGMA schema_version").fetchone()
+    rows = conn.execute(
+        f"EXPLAIN QUERY PLAN /* schema {schema_version} */ {sql}", params if params is not None else ()
+    ).fetchall()
+    return [{"id": r[0], "parent": r[1], "detail": r[3]} for r in rows]
+
+
+def analyze_plan(conn: sqlite3.Connection, sql: str, plan: list[dict[str, Any]]) -> dict[str, Any]:
+    """Annotates EXPLAIN QUERY PLAN steps with scan/sort flags and row estimates"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    aliases = _table_aliases(sql, tables)
+    statistics = _plan_statistics(conn)
+    table_rows, index_stats = statistics or ({}, {})
+    unique_indexes = {
+        row[0]
+        for row in conn.execute(
+            "SELECT il.name FROM sqlite_master AS m, pragma_index_list(m.name) AS il "
+            "WHERE m.type = 'table' AND il.\"unique\""
+        )
+    }
+    warnings = []
+    loop_rows = 1
+    estimated_total = 0
+    steps = []
+    for node in plan:
+        step = dict(node)
+        detail = node["detail"]
+        match = _PLAN_STEP_RE.match(detail)
+        if "TEMP B-TREE" in detail:
+            step["temp_btree"] = True
+            warnings.append(f"temporary B-tree sort: {detail}")
+        if match:
+            kind, name, alias, using, constraint = match.groups()
+            table = aliases.get(alias or name, aliases.get(name, name))
+            step["table"] = table
+            using = using or ""
+            constraint = constraint or ""
+            rows = table_rows.get(table)
+            if rows is None and table in tables:
+                rows = _approximate_rows(conn, table)
+                table_rows[table] = rows if rows is not None else 0
+            if "INDEX" in using:
+                step["index"] = using.split("INDEX", 1)[1].strip() or "automatic"
+            equalities = len(re.findall(r"(?<![<>!])=", constraint))
+            if kind == "SCAN":
+                step["full_scan"] = True
+                what = f"index {step['index']}" if "index" in step else "table"
+                warnings.append(f"full {what} scan of {table}" + (f" (~{rows} rows)" if rows else ""))
+                estimate = rows
+            elif using.startswith("INTEGER PRIMARY KEY") or using.startswith("PRIMARY KEY"):
+                estimate = 1 if equalities else (rows or 0) // 4
+            else:
+                stats = index_stats.get(step.get("index", ""))
+                if step.get("index") in unique_indexes and equalities and not re.search(r"[<>]", constraint):
+                    estimate = 1
+                elif stats and equalities and len(stats) > equalities:
+                    estimate = stats[equalities]
+                elif equalities:
+                    # SQLite's own default guess for an equality lookup without statistics
+                    estimate = 10
+                else:
+                    estimate = (rows or 0) // 4
+            step["estimated_rows"] = estimate
+            if estimate is not None:
+                # Nested loops: each step runs once per row produced by the steps before it
+                if node["parent"] == 0:
+                    estimated_total += loop_rows * max(estimate, 1)
+                    loop_rows *= max(estimate, 1)
+                else:
+                    estimated_total += max(estimate, 1)
+        steps.append(step)
+    return {
+        "steps": steps,
+        "estimated_rows_touched": estimated_total,
+        "statistics": "sqlite_stat1" if statistics is not None else "approximate (run ANALYZE for better estimates)",
+        "warnings": warnings,
+    }
+
+
+def format_plan(analysis: dict[str, Any]) -> str:
+    children: dict[int, list[dict[str, Any]]] = {}
+    for step in analysis["steps"]:
+        children.setdefault(step["parent"], []).append(step)
+
+    lines = [f"QUERY PLAN (~{analysis['estimated_rows_touched']} rows touched, {analysis['statistics']})"]
+
+    def walk(parent: int, prefix: str) -> None:
+        siblings = children.get(parent, [])
+        for i, step in enumerate(siblings):
+            last = i == len(siblings) - 1
+            notes = []
+            if step.get("full_scan"):
+                notes.append("FULL SCAN")
+            if step.get("temp_btree"):
+                notes.append("TEMP B-TREE")
+            if step.get("estimated_rows") is not None:
+                notes.append(f"~{step['estimated_rows']} rows")
+            suffix = f"  [{', '.join(notes)}]" if notes else ""
+            lines.append(f"{prefix}{'`--' if last else '|--'}{step['detail']}{suffix}")
+            walk(step["id"], prefix + ("   " if last else "|  "))
+
+    walk(0, "")
+    if analysis["warnings"]:
+        lines.append("Warnings:")
+        lines.extend(f"- {w}" for w in analysis["warnings"])
+    return "\n".join(lines)
+
+
+class WorkloadLog:
+    """Recently executed statements by fingerprint, with how often they ran and how long they took"""
+
+    def __init__(self, max_statements: int = 500):
+        self.max_statements = max_statements
+        self._statements: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, elapsed_ms: float, params: Any = None, fingerprint: str | None = None) -> None:
+        fingerprint = fingerprint or normalize_sql(sql)
+        with self._lock:
+            entry = self._statements.pop(fingerprint, None)
+            if entry is None:
+                entry = {"sql": sql, "params": params, "count": 0, "total_ms": 0.0}
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            self._statements[fingerprint] = entry
+            while len(self._statements) > self.max_statements:
+                self._statements.popitem(last=False)
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [dict(entry, fingerprint=fp) for fp, entry in self._statements.items()]
+
+
+class SlowQueryLog:
+    """Statements slower than a threshold, appended to a JSONL file that rotates into numbered backups"""
+
+    def __init__(self, path: str, threshold_ms: float, max_bytes: int, backups: int):
+        self.path = Path(path)
+        self.threshold_ms = threshold_ms
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def is_slow(self, elapsed_ms: float) -> bool:
+        return self.threshold_ms > 0 and elapsed_ms >= self.threshold_ms
+
+    def _rotate(self) -> None:
+        # slow_queries.jsonl -> .1 -> .2 ...; the oldest backup is dropped
+        for n in range(self.backups, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{n}")
+            newer = self.path.with_name(f"{self.path.name}.{n - 1}") if n > 1 else self.path
+            if newer.exists():
+                os.replace(newer, older)
+        if self.backups <= 0:
+            self.path.unlink(missing_ok=True)
+
+    def record(
+        self,
+        conn: sqlite3.Connection,
+        database: str,
+        sql: str,
+        elapsed_ms: float,
+        rows_returned: int,
+        vm_steps: int,
+        params: Any = None,
+    ) -> None:
+        """Captures the plan of a slow statement on `conn` and appends it to the log"""
+        fingerprint, literals = fingerprint_sql(sql)
+        try:
+            analysis = analyze_plan(conn, sql, query_plan(conn, sql, params))
+            plan, scanned, warnings = [s["detail"] for s in analysis["steps"]], analysis["estimated_rows_touched"], analysis["warnings"]
+        except sqlite3.Error as e:
+            plan, scanned, warnings = None, None, [f"no plan: {e}"]
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "database": database,
+            "fingerprint": fingerprint,
+            "sql": sql,
+            "literals": literals,
+            "params": params,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "rows_returned": rows_returned,
+            "rows_scanned_estimate": scanned,
+            "vm_steps": vm_steps,
+            "plan": plan,
+            "warnings": warnings,
+        }
+        line = json.dumps(entry, default=_json_value) + "\n"
+        logger.warning(f"Slow query on {database} ({elapsed_ms:.0f} ms): {fingerprint}")
+        with self._lock:
+            try:
+                if self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+                    self._rotate()
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"Writing slow query log {self.path} failed: {e}")
+
+    def entries(self) -> Iterator[dict[str, Any]]:
+        paths = [self.path.with_name(f"{self.path.name}.{n}") for n in range(self.backups, 0, -1)] + [self.path]
+        with self._lock:
+            for path in paths:
+                if not path.exists():
+                    continue
+                with path.open(encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+
+    def offenders(self, limit: int | None = None, database: str | None = None) -> list[dict[str, Any]]:
+        """Fingerprints ranked by total time across the log (optionally one database's), with their latest run's plan"""
+        grouped: dict[tuple[str, str], dict[str, Any]] = {}
+        for entry in self.entries():
+            name = entry.get("database", DEFAULT_DATABASE)
+            if database is not None and name != database:
+                continue
+            group = grouped.setdefault((name, entry["fingerprint"]), {
+                "database": name, "fingerprint": entry["fingerprint"], "count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows_returned": 0,
+            })
+            group["count"] += 1
+            group["total_ms"] += entry["elapsed_ms"]
+            group["max_ms"] = max(group["max_ms"], entry["elapsed_ms"])
+            group["rows_returned"] += entry["rows_returned"]
+            for field in ("sql", "literals", "params", "rows_scanned_estimate", "plan", "warnings", "time"):
+                group[field] = entry.get(field)
+        ranked = sorted(grouped.values(), key=lambda g: g["total_ms"], reverse=True)[:limit]
+        for group in ranked:
+            group["total_ms"] = round(group["total_ms"], 3)
+            group["avg_ms"] = round(group["total_ms"] / group["count"], 3)
+            group["avg_rows_returned"] = round(group.pop("rows_returned") / group["count"], 1)
+            group["last_seen"] = group.pop("time")
+        return ranked
+
+
+# Column before a comparison, and qualified column after one (the other side of a join condition)
+_PREDICATE_LEFT_RE = re.compile(r"(?:\b(\w+)\.)?\b(\w+)\s*(==|=|<>|!=|<=|>=|<|>|\bin\b|\bis\b|\bbetween\b)")
+_PREDICATE_RIGHT_RE = re.compile(r"(==|=|<=|>=|<|>)\s*(\w+)\.(\w+)\b")
+_COLUMN_REF_RE = re.compile(r"(?:\b(\w+)\.)?\b(\w+)\b")
+_ORDER_BY_RE = re.compile(r"\border by (.+?)(?:\blimit\b|$)")
+
+
+def _index_candidates(sql: str, table: str, columns: list[str], aliases: dict[str, str]) -> dict[str, list[str]]:
+    """Finds a table's columns used in equality, range and ORDER BY terms of a statement"""
+    text = re.sub(r"'(?:[^']|'')*'", "?", normalize_sql(sql))
+    known = {c.lower(): c for c in columns}
+    names = {a for a, t in aliases.items() if t == table}
+    equality: list[str] = []
+    ranges: list[str] = []
+    referenced: list[str] = []
+
+    def resolve(qualifier: str | None, name: str) -> str | None:
+        if qualifier and qualifier not in names:
+            return None
+        return known.get(name.lower())
+
+    predicates = [(m.group(1), m.group(2), m.group(3)) for m in _PREDICATE_LEFT_RE.finditer(text)]
+    predicates += [(m.group(2), m.group(3), m.group(1)) for m in _PREDICATE_RIGHT_RE.finditer(text)]
+    for qualifier, name, op in predicates:
+        column = resolve(qualifier, name)
+        if column is None:
+            continue
+        target = ranges if op in ("<", ">", "<=", ">=", "between") else equality if op in ("=", "==", "in", "is") else None
+        if target is not None and column not in target:
+            target.append(column)
+    order_by = []
+    order = _ORDER_BY_RE.search(text)
+    if order:
+        for term in order.group(1).split(","):
+            ref = term.strip().split(" ")[0].split(".")
+            column = resolve(ref[0] if len(ref) == 2 else None, ref[-1])
+            if column and column not in order_by:
+                order_by.append(column)
+    for match in _COLUMN_REF_RE.finditer(text):
+        column = resolve(match.group(1), match.group(2))
+        if column and column not in referenced:
+            referenced.append(column)
+    return {"equality": equality, "range": [c for c in ranges if c not in equality], "order_by": order_by, "referenced": referenced}
+
+
+def _existing_index_prefixes(conn: sqlite3.Connection, table: str) -> list[list[str]]:
+    quoted = _quote_identifier(table)
+    prefixes = []
+    for _, name, *_ in conn.execute(f"PRAGMA index_list({quoted})"):
+        prefixes.append([info[2] for info in conn.execute(f"PRAGMA index_info({_quote_identifier(name)})")])
+    return prefixes
+
+
+def advise_indexes(conn: sqlite3.Connection, workload: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Proposes composite or covering indexes for full scans seen in the recorded workload"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    table_columns = {}
+    rowid_aliases = {}
+    for t in tables:
+        info = conn.execute(f"PRAGMA table_info({_quote_identifier(t)})").fetchall()
+        table_columns[t] = [row[1] for row in info]
+        pks = [row for row in info if row[5]]
+        # An INTEGER PRIMARY KEY is the rowid, which every index already carries
+        if len(pks) == 1 and pks[0][2].upper() == "INTEGER":
+            rowid_aliases[t] = pks[0][1]
+    proposals: dict[tuple[str, tuple[str, ...]], dict[str, Any]] = {}
+    for entry in workload:
+        try:
+            analysis = analyze_plan(conn, entry["sql"], query_plan(conn, entry["sql"], entry["params"]))
+        except sqlite3.Error:
+            continue
+        aliases = _table_aliases(entry["sql"], tables)
+        for step in analysis["steps"]:
+            table = step.get("table")
+            automatic = step.get("index") == "automatic" or "AUTOMATIC" in step["detail"]
+            if table not in tables or not (step.get("full_scan") or automatic):
+                continue
+            found = _index_candidates(entry["sql"], table, table_columns[table], aliases)
+            # Equalities first, then at most one range column, which ends the usable prefix
+            key_columns = found["equality"] + found["range"][:1]
+            if not found["range"]:
+                key_columns += [c for c in found["order_by"] if c not in key_columns]
+            if not key_columns:
+                continue
+            extra = [c for c in found["referenced"] if c not in key_columns and c != rowid_aliases.get(table)]
+            covering = 0 < len(extra) <= 3 and len(key_columns) + len(extra) < len(table_columns[table])
+            columns = tuple(key_columns + extra) if covering else tuple(key_columns)
+            if any(prefix[: len(columns)] == list(columns) for prefix in _existing_index_prefixes(conn, table)):
+                continue
+            if automatic:
+                # SQLite rebuilds an automatic index from the whole table on every run
+                benefit = (_approximate_rows(conn, table) or 0) * entry["count"]
+            else:
+                # A scan of `rows` becomes a lookup of roughly SQLite's default 10 rows per key
+                benefit = max((step.get("estimated_rows") or 0) - 10, 0) * entry["count"]
+            key = (table, columns)
+            proposal = proposals.get(key)
+            if proposal is None:
+                name = "idx_" + "_".join([table, *columns])
+                cols = ", ".join(_quote_identifier(c) for c in columns)
+                proposal = proposals[key] = {
+                    "name": name,
+                    "table": table,
+                    "columns": list(columns),
+                    "covering": covering,
+                    "sql": f"CREATE INDEX IF NOT EXISTS {_quote_identifier(name)} ON {_quote_identifier(table)} ({cols})",
+                    "estimated_rows_saved": 0,
+                    "statements": [],
+                }
+            proposal["estimated_rows_saved"] += benefit
+            if entry["fingerprint"] not in proposal["statements"]:
+                proposal["statements"].append(entry["fingerprint"])
+    # An index whose columns lead another proposal on the same table is served by that one
+    merged = []
+    for (table, columns), proposal in proposals.items():
+        wider = [
+            other for (t, cols), other in proposals.items()
+            if t == table and len(cols) > len(columns) and cols[: len(columns)] == columns
+        ]
+        if wider:
+            wider[0]["estimated_rows_saved"] += proposal["estimated_rows_saved"]
+            wider[0]["statements"] += [s for s in proposal["statements"] if s not in wider[0]["statements"]]
+        else:
+            merged.append(proposal)
+    return sorted(merged, key=lambda p: p["estimated_rows_saved"], reverse=True)
+
+
+def column_affinity(declared_type: str | None) -> str:
+    """SQLite's type affinity rules (https://sqlite.org/datatype3.html#determination_of_column_affinity)"""
+    decl = (declared_type or "").upper()
+    if "INT" in decl:
+        return "INTEGER"
+    if any(t in decl for t in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if not decl or "BLOB" in decl:
+        return "BLOB"
+    if any(t in decl for t in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+def _coerce(value: Any, affinity: str, empty_is_null: bool = False) -> Any:
+    """Converts a value read from CSV/JSON to the column's affinity, keeping it as-is when it doesn't parse
+
+    CSV has no way to spell NULL, so its empty cells are read as one; JSON's "" stays an empty string.
+    """
+    if value is None or (empty_is_null and value == ""):
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if affinity == "TEXT":
+        return value if isinstance(value, str) else str(value)
+    if affinity in ("INTEGER", "REAL", "NUMERIC") and isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        if affinity == "REAL":
+            return number
+        if number.is_integer() and abs(number) < 2**63:
+            return int(number)
+        return number
+    return value
+
+
+def _read_records(path: Path, file_format: str) -> Iterator[dict[str, Any]]:
+    with path.open(newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class PartialImportError(Exception):
+    """An import that failed after some of its batches were already committed"""
+
+    def __init__(self, error: BaseException, rows: int, batches: int):
+        super().__init__(f"{error} ({rows} rows in {batches} batches before it were already committed)")
+        self.rows = rows
+        self.batches = batches
+
+
+def import_file(
+    conn: sqlite3.Connection,
+    path: Path,
+    table: str,
+    file_format: str,
+    batch_size: int,
+    on_conflict: str,
+    drop_indexes: bool,
+) -> dict[str, Any]:
+    """Streams a CSV/JSONL file into a table with executemany, committing once per batch"""
+    info = conn.execute(f"PRAGMA table_info({_quote_identifier(table)})").fetchall()
+    if not info:
+        raise ValueError(f"no such table: {table}")
+    affinities = {row[1].lower(): (row[1], column_affinity(row[2])) for row in info}
+
+    records = _read_records(path, file_format)
+    first = next(records, None)
+    if first is None:
+        return {"rows": 0, "batches": 0, "seconds": 0.0, "rows_per_second": 0.0, "ignored_columns": []}
+    # CSV records all share the header; JSONL records each name their own keys, matched case-insensitively
+    ignored: list[str] = []
+    empty_is_null = file_format == "csv"
+
+    def prepare(record: dict[str, Any]) -> tuple[tuple[str, ...], tuple[Any, ...]]:
+        values: dict[str, tuple[Any, str]] = {}
+        for key, value in record.items():
+            target = affinities.get(key.lower())
+            if target is None:
+                if key not in ignored:
+                    ignored.append(key)
+            else:
+                values[target[0]] = (value, target[1])
+        if not values:
+            raise ValueError(f"none of the record's columns exist in {table}")
+        # Keys a record leaves out are left out of its INSERT, so they get the column default (NULL unless declared)
+        return tuple(values), tuple(_coerce(value, affinity, empty_is_null) for value, affinity in values.values())
+
+    verb = "INSERT" if on_conflict == "abort" else f"INSERT OR {on_conflict.upper()}"
+    inserts: dict[tuple[str, ...], str] = {}
+
+    def insert_sql(columns: tuple[str, ...]) -> str:
+        if columns not in inserts:
+            inserts[columns] = (
+                f"{verb} INTO {_quote_identifier(table)} ({', '.join(_quote_identifier(name) for name in columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})"
+            )
+        return inserts[columns]
+
+    # Fails before any index is dropped when the file doesn't fit the table at all
+    prepare(first)
+
+    dropped: list[str] = []
+    if drop_indexes:
+        # Only plain CREATE INDEX ones: unique indexes enforce constraints the loaded rows must be checked against
+        names = [
+            row[1] for row in conn.execute(f"PRAGMA index_list({_quote_identifier(table)})") if row[3] == "c" and not row[2]
+        ]
+        for name in names:
+            index_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone()[0]
+            conn.execute(f"DROP INDEX {_quote_identifier(name)}")
+            dropped.append(index_sql)
+        conn.commit()
+
+    started = time.perf_counter()
+    total = 0
+    batches = 0
+    rows_iter = (prepare(record) for record in itertools.chain([first], records))
+    try:
+        while True:
+            batch = list(itertools.islice(rows_iter, batch_size))
+            if not batch:
+                break
+            # One executemany per run of records with the same keys, so file order is kept
+            for columns, run in itertools.groupby(batch, key=lambda prepared: prepared[0]):
+                conn.executemany(insert_sql(columns), [row for _, row in run])
+            conn.commit()
+            total += len(batch)
+            batches += 1
+    except Exception as e:
+        if total:
+            raise PartialImportError(e, total, batches) from e
+        raise
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        # Rebuilding once after the load is much cheaper than maintaining the index per row
+        for index_sql in dropped:
+            conn.execute(index_sql)
+        if dropped:
+            conn.commit()
+    seconds = time.perf_counter() - started
+    return {
+        "rows": total,
+        "batches": batches,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(total / seconds, 1) if seconds else 0.0,
+        "ignored_columns": ignored,
+        "rebuilt_indexes": len(dropped),
+    }
+
+
+def _widen_storage_class(current: str, seen: str) -> str:
+    """The narrowest storage class holding values of both; mixed kinds fall back to TEXT"""
+    if current == "NULL":
+        return seen
+    if seen in ("NULL", current):
+        return current
+    return "REAL" if {current, seen} == {"INTEGER", "REAL"} else "TEXT"
+
+
+class _ParquetSink:
+    """Writes row batches to a Parquet file; pyarrow is only needed when this format is used.
+
+    Column types follow the storage classes seen so far. When a batch doesn't fit them (a REAL in an INTEGER column,
+    text in a numeric one) the column is widened and the rows already written are copied to a file with the new schema.
+    """
+
+    def __init__(self, path: Path, columns: list[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.columns = columns
+        self.storage_classes = ["NULL"] * len(columns)
+        self._arrow_types = {
+            "NULL": pa.string(), "INTEGER": pa.int64(), "REAL": pa.float64(), "BLOB": pa.binary(), "TEXT": pa.string(),
+        }
+        self._writer = None
+
+    def _schema(self) -> Any:
+        return self._pa.schema(
+            [(name, self._arrow_types[storage_class]) for name, storage_class in zip(self.columns, self.storage_classes)]
+        )
+
+    def _write_columns(self, values: list[list[Any]]) -> None:
+        arrays = []
+        for col, storage_class in zip(values, self.storage_classes):
+            if storage_class in ("TEXT", "NULL"):
+                col = [v if v is None or isinstance(v, str) else str(_json_value(v)) for v in col]
+            elif storage_class == "REAL":
+                col = [v if v is None else float(v) for v in col]
+            arrays.append(self._pa.array(col, type=self._arrow_types[storage_class]))
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema()))
+
+    def _rewrite(self) -> None:
+        self._writer.close()
+        previous = self.path.with_name(self.path.name + ".old")
+        os.replace(self.path, previous)
+        try:
+            self._writer = self._pq.ParquetWriter(str(self.path), self._schema())
+            # One row group at a time, so widening never holds the whole file in memory
+            for batch in self._pq.ParquetFile(str(previous)).iter_batches():
+                self._write_columns([batch.column(i).to_pylist() for i in range(batch.num_columns)])
+        finally:
+            previous.unlink(missing_ok=True)
+
+    def write(self, rows: list[tuple]) -> None:
+        values = [list(col) for col in zip(*rows)]
+        storage_classes = [_widen_storage_class(c, _storage_class(col)) for c, col in zip(self.storage_classes, values)]
+        if storage_classes != self.storage_classes:
+            self.storage_classes = storage_classes
+            if self._writer is not None:
+                self._rewrite()
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(str(self.path), self._schema())
+        self._write_columns(values)
+
+    def close(self) -> None:
+        # An empty result still gets a file, with every column typed as string
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(str(self.path), self._schema())
+        self._writer.close()
+
+
+def export_rows(cursor: sqlite3.Cursor, path: Path, file_format: str, batch_size: int) -> int:
+    """Streams a cursor to a CSV, JSONL or Parquet file with fetchmany and returns the row count"""
+    columns = _column_names(cursor)
+    total = 0
+    if file_format == "parquet":
+        sink = _ParquetSink(path, columns)
+        try:
+            while rows := cursor.fetchmany(batch_size):
+                sink.write(rows)
+                total += len(rows)
+        finally:
+            sink.close()
+        return total
+
+    with path.open("w", newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            while rows := cursor.fetchmany(batch_size):
+                writer.writerows([[_json_value(v) for v in row] for row in rows])
+                total += len(rows)
+        else:
+            while rows := cursor.fetchmany(batch_size):
+                f.writelines(json.dumps(dict(zip(columns, row)), default=_json_value) + "\n" for row in rows)
+                total += len(rows)
+    return total
+
+
+class StatsMaintainer:
+    """Keeps sqlite_stat1 fresh by re-running ANALYZE on tables whose size drifted from their statistics"""
+
+    def __init__(self, database: Database, interval: float, analysis_limit: int, drift: float):
+        self.database = database
+        self.interval = interval
+        self.analysis_limit = analysis_limit
+        self.drift = drift
+        self.last_analyzed: dict[str, datetime] = {}
+        self._baseline: dict[str, int | None] = {}
+        self.last_check: datetime | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def table_status(self) -> list[dict[str, Any]]:
+        with self.database.reader() as conn:
+            # Virtual tables keep no sqlite_stat1 rows, so they'd look stale forever
+            tables = [name for name, _ in user_tables(conn, include_virtual=False)]
+            statistics = _plan_statistics(conn)
+            stat_rows = statistics[0] if statistics else {}
+            status = []
+            for table in tables:
+                # MAX(rowid) may sit well above the row count after deletes, so growth is measured
+                # against the MAX(rowid) seen when this process last analyzed the table. Before that, the
+                # sqlite_stat1 row count is the baseline, so growth from earlier sessions isn't missed
+                current = _approximate_rows(conn, table)
+                analyzed = stat_rows.get(table)
+                baseline = self._baseline.get(table, analyzed)
+                if analyzed is None or current is None or baseline is None:
+                    drift = None
+                else:
+                    drift = abs(current - baseline) / max(analyzed, 1)
+                refreshed = self.last_analyzed.get(table)
+                status.append({
+                    "table": table,
+                    "stat_rows": analyzed,
+                    "max_rowid": current,
+                    "drift": round(drift, 4) if drift is not None else None,
+                    "stale": analyzed is None or (drift is not None and drift > self.drift),
+                    "last_analyzed": refreshed.isoformat() if refreshed else ("before server start" if analyzed is not None else "never"),
+                })
+        return status
+
+    def mark_analyzed(self) -> None:
+        """Records that a full ANALYZE just ran outside refresh(), making the current sizes the new baselines"""
+        with self.database.reader() as conn:
+            for table, _ in user_tables(conn, include_virtual=False):
+                self.last_analyzed[table] = datetime.now(timezone.utc)
+                self._baseline[table] = _approximate_rows(conn, table)
+
+    def refresh(self, force: bool = False) -> list[str]:
+        """Analyzes tables without statistics or whose row count drifted; returns the tables analyzed"""
+        self.last_check = datetime.now(timezone.utc)
+        status = {s["table"]: s for s in self.table_status() if force or (s["stale"] and s["max_rowid"])}
+        stale = list(status)
+        if not stale:
+            return []
+        with self.database.writer() as conn:
+            # analysis_limit samples each index instead of reading it fully, so large tables stay cheap
+            conn.execute(f"PRAGMA analysis_limit={int(self.analysis_limit)}")
+            for table in stale:
+                conn.execute(f"ANALYZE {_quote_identifier(table)}")
+                self.last_analyzed[table] = datetime.now(timezone.utc)
+                self._baseline[table] = status[table]["max_rowid"]
+            conn.commit()
+        logger.info(f"Refreshed planner statistics for {', '.join(stale)}")
+        return stale
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Background ANALYZE failed: {e}")
+
+    def start(self) -> None:
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="sqlite-analyze", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# Summary tables over purchase_orders: key columns as expressions over a purchase_orders row ({row})
+PURCHASE_SUMMARIES: dict[str, dict[str, str]] = {
+    "purchase_summary_by_user": {"user_id": "{row}.user_id"},
+    "purchase_summary_by_sku_month": {"sku_name": "{row}.sku_name", "month": "substr({row}.record_date, 1, 7)"},
+    "purchase_summary_by_day": {"day": "substr({row}.record_date, 1, 10)"},
+}
+# Category totals were once materialized too, but went stale whenever a SKU's category changed
+_LEGACY_SUMMARIES = ("purchase_summary_by_category_month",)
+_SUMMARY_TRIGGERS = ("purchase_summary_insert", "purchase_summary_delete", "purchase_summary_update")
+
+
+def _summary_delta(table: str, row: str, sign: str) -> str:
+    """Upserts one purchase_orders row into a summary table, adding (sign "+") or removing (sign "-") it"""
+    keys = PURCHASE_SUMMARIES[table]
+    exprs = [expr.format(row=row) for expr in keys.values()]
+    not_null = " AND ".join(f"{e} IS NOT NULL" for e in exprs)
+    key_list = ", ".join(keys)
+    sql = (
+        f"INSERT INTO {table} ({key_list}, order_count, revenue) "
+        f"SELECT {', '.join(exprs)}, {sign}1, {sign}IFNULL({row}.sku_price, 0) WHERE {not_null} "
+        f"ON CONFLICT ({key_list}) DO UPDATE SET "
+        f"order_count = order_count + excluded.order_count, revenue = revenue + excluded.revenue;"
+    )
+    if sign == "-":
+        match = " AND ".join(f"{k} = {e}" for k, e in zip(keys, exprs))
+        sql += f"\n    DELETE FROM {table} WHERE {match} AND order_count <= 0;"
+    return sql
+
+
+def _summary_source(table: str) -> str:
+    """The aggregate over purchase_orders that a summary table materializes"""
+    keys = PURCHASE_SUMMARIES[table]
+    exprs = [expr.format(row="p") for expr in keys.values()]
+    columns = ", ".join(f"{e} AS {k}" for k, e in zip(keys, exprs))
+    not_null = " AND ".join(f"{e} IS NOT NULL" for e in exprs)
+    return (
+        f"SELECT {columns}, count(*) AS order_count, sum(IFNULL(p.sku_price, 0)) AS revenue "
+        f"FROM purchase_orders AS p WHERE {not_null} GROUP BY {', '.join(str(i) for i in range(1, len(keys) + 1))}"
+    )
+
+
+def create_purchase_summaries(conn: sqlite3.Connection, rebuild: bool = False) -> list[str]:
+    """Creates the summary tables and their purchase_orders triggers, backfilling them in one transaction"""
+    created = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        legacy = [
+            name for name in _LEGACY_SUMMARIES
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+        ]
+        # Existing triggers still write to the legacy tables, so they are replaced along with them
+        replace_triggers = rebuild or bool(legacy)
+        for name in legacy:
+            for trigger in _SUMMARY_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute(f"DROP TABLE {name}")
+        for table, keys in PURCHASE_SUMMARIES.items():
+            if rebuild:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if exists:
+                continue
+            conn.execute(
+                f"CREATE TABLE {table} ({', '.join(keys)}, order_count INTEGER NOT NULL, revenue REAL NOT NULL, "
+                f"PRIMARY KEY ({', '.join(keys)})) WITHOUT ROWID"
+            )
+            conn.execute(f"INSERT INTO {table} {_summary_source(table)}")
+            created.append(table)
+
+        inserts = "\n    ".join(_summary_delta(t, "NEW", "+") for t in PURCHASE_SUMMARIES)
+        deletes = "\n    ".join(_summary_delta(t, "OLD", "-") for t in PURCHASE_SUMMARIES)
+        triggers = {
+            "purchase_summary_insert": f"AFTER INSERT ON purchase_orders BEGIN\n    {inserts}\nEND",
+            "purchase_summary_delete": f"AFTER DELETE ON purchase_orders BEGIN\n    {deletes}\nEND",
+            "purchase_summary_update": (
+                "AFTER UPDATE OF user_id, sku_name, sku_price, record_date ON purchase_orders BEGIN\n"
+                f"    {deletes}\n    {inserts}\nEND"
+            ),
+        }
+        for name, body in triggers.items():
+            if replace_triggers:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return created
+
+
+def purchase_summaries_installed(conn: sqlite3.Connection) -> bool:
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    return set(PURCHASE_SUMMARIES) | set(_SUMMARY_TRIGGERS) <= names
+
+
+# Reports answered from the summary tables, as (summary table, query with {source} standing for it)
+SUMMARY_REPORTS: dict[str, tuple[str, str]] = {
+    "revenue_per_user": (
+        "purchase_summary_by_user",
+        "SELECT s.user_id, u.name, s.order_count, round(s.revenue, 2) AS revenue "
+        "FROM {source} AS s LEFT JOIN users AS u ON u.id = s.user_id ORDER BY s.revenue DESC LIMIT :limit",
+    ),
+    "top_skus": (
+        "purchase_summary_by_sku_month",
+        "SELECT sku_name, sum(order_count) AS order_count, round(sum(revenue), 2) AS revenue "
+        "FROM {source} WHERE :month IS NULL OR month = :month GROUP BY sku_name ORDER BY sum(revenue) DESC LIMIT :limit",
+    ),
+    "sales_by_day": (
+        "purchase_summary_by_day",
+        "SELECT day, order_count, round(revenue, 2) AS revenue "
+        "FROM {source} WHERE :month IS NULL OR substr(day, 1, 7) = :month ORDER BY day DESC LIMIT :limit",
+    ),
+    "sales_by_month": (
+        "purchase_summary_by_day",
+        "SELECT substr(day, 1, 7) AS month, sum(order_count) AS order_count, round(sum(revenue), 2) AS revenue "
+        "FROM {source} WHERE :month IS NULL OR substr(day, 1, 7) = :month GROUP BY 1 ORDER BY 1 DESC LIMIT :limit",
+    ),
+    # Categories are joined at read time, so recategorized or late-added SKUs count under their current category
+    "spend_by_category": (
+        "purchase_summary_by_sku_month",
+        "SELECT IFNULL(k.sku_category, 'Uncategorized') AS sku_category, sum(s.order_count) AS order_count, "
+        "round(sum(s.revenue), 2) AS revenue FROM {source} AS s LEFT JOIN food_beverage_skus AS k ON k.sku_name = s.sku_name "
+        "WHERE :month IS NULL OR s.month = :month GROUP BY 1 ORDER BY sum(s.revenue) DESC LIMIT :limit",
+    ),
+}
+
+
+def summary_report(conn: sqlite3.Connection, report: str, month: str | None, limit: int) -> tuple[sqlite3.Cursor, bool]:
+    """Runs a report from its summary table, or from purchase_orders directly when summaries aren't installed"""
+    table, query = SUMMARY_REPORTS[report]
+    installed = purchase_summaries_installed(conn)
+    source = table if installed else f"({_summary_source(table)})"
+    return conn.execute(query.format(source=source), {"month": month, "limit": limit}), installed
+
+
+# Tables indexed by product_search. FTS rowids interleave sources (rowid * 2 + offset) so triggers can
+# update an entry by rowid without scanning.
+PRODUCT_SEARCH_SOURCES: dict[str, tuple[str, int]] = {
+    "food_beverage_skus": ("sku", 0),
+    "inventory": ("inventory", 1),
+}
+
+
+def create_product_search(conn: sqlite3.Connection, rebuild: bool = False) -> bool:
+    """Creates the product_search FTS5 index with sync triggers; returns whether it was (re)built"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if rebuild:
+            conn.execute("DROP TABLE IF EXISTS product_search")
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'product_search'").fetchone()
+        if not exists:
+            conn.execute(
+                "CREATE VIRTUAL TABLE product_search USING fts5("
+                "source UNINDEXED, sku_name, sku_description, sku_category, "
+                "tokenize = 'porter unicode61', prefix = '2 3')"
+            )
+        for table, (source, offset) in PRODUCT_SEARCH_SOURCES.items():
+            fts_row = "{row}.rowid * 2 + " + str(offset)
+            insert = (
+                "INSERT INTO product_search (rowid, source, sku_name, sku_description, sku_category) "
+                f"VALUES ({fts_row.format(row='NEW')}, '{source}', NEW.sku_name, NEW.sku_description, NEW.sku_category);"
+            )
+            delete = f"DELETE FROM product_search WHERE rowid = {fts_row.format(row='OLD')};"
+            # Only indexed columns (and an INTEGER PRIMARY KEY, which moves the rowid), so stock updates skip the index
+            pk = [(col, col_type) for _, col, col_type, _, _, is_pk in conn.execute(f"PRAGMA table_info({table})") if is_pk]
+            rowid_alias = [pk[0][0]] if len(pk) == 1 and pk[0][1].upper() == "INTEGER" else []
+            watched = ", ".join(["sku_name", "sku_description", "sku_category", *rowid_alias])
+            triggers = {
+                f"product_search_{source}_insert": f"AFTER INSERT ON {table} BEGIN {insert} END",
+                f"product_search_{source}_delete": f"AFTER DELETE ON {table} BEGIN {delete} END",
+                f"product_search_{source}_update": f"AFTER UPDATE OF {watched} ON {table} BEGIN {delete} {insert} END",
+            }
+            for name, body in triggers.items():
+                # Always recreated, so indexes installed by earlier versions pick up the current definitions
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                conn.execute(f"CREATE TRIGGER {name} {body}")
+            if not exists:
+                conn.execute(
+                    "INSERT INTO product_search (rowid, source, sku_name, sku_description, sku_category) "
+                    f"SELECT {fts_row.format(row=table)}, '{source}', sku_name, sku_description, sku_category FROM {table}"
+                )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return not exists
+
+
+def _fts_query(text: str) -> str:
+    """Turns free text into an FTS5 query: every word must match, as a prefix"""
+    terms = re.findall(r"\w+", text)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_products_in(
+    conn: sqlite3.Connection, text: str, source: str, limit: int, raw: bool
+) -> tuple[sqlite3.Cursor, bool]:
+    """Ranks products by BM25 over the FTS index, or falls back to LIKE scans when it isn't installed"""
+    installed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'product_search'").fetchone() is not None
+    sources = [s for s, _ in PRODUCT_SEARCH_SOURCES.values()] if source == "all" else [source]
+    if installed:
+        # Column weights: sku_name matches count most, then description, then category
+        sql = (
+            "SELECT source, sku_name, sku_category, "
+            "snippet(product_search, 2, '[', ']', '…', 12) AS snippet, "
+            "round(bm25(product_search, 0, 5.0, 2.0, 1.0), 3) AS score "
+            "FROM product_search WHERE product_search MATCH :query "
+            f"AND source IN ({', '.join(repr(s) for s in sources)}) ORDER BY score LIMIT :limit"
+        )
+        return conn.execute(sql, {"query": text if raw else _fts_query(text), "limit": limit}), True
+    terms = re.findall(r"\w+", text)
+    parts = []
+    params: dict[str, Any] = {"limit": limit}
+    for table, (src, _) in PRODUCT_SEARCH_SOURCES.items():
+        if src not in sources:
+            continue
+        conditions = []
+        for i, term in enumerate(terms):
+            params[f"t{i}"] = f"%{term}%"
+            conditions.append(f"(sku_name LIKE :t{i} OR sku_description LIKE :t{i} OR sku_category LIKE :t{i})")
+        where = " AND ".join(conditions) or "1"
+        parts.append(
+            f"SELECT '{src}' AS source, sku_name, sku_category, sku_description AS snippet, NULL AS score FROM {table} WHERE {where}"
+        )
+    return conn.execute(" UNION ALL ".join(parts) + " LIMIT :limit", params), False
+
+
+def sample_rows(conn: sqlite3.Connection, table: str, n: int, seed: int | None) -> tuple[list[tuple], list[str], str]:
+    """Uniform random sample of n rows: random rowid probes on rowid tables, reservoir sampling otherwise"""
+    rng = random.Random(seed)
+    quoted = _quote_identifier(table)
+    columns = _column_names(conn.execute(f"SELECT * FROM {quoted} LIMIT 0"))
+    try:
+        low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {quoted}").fetchone()
+    except sqlite3.OperationalError:
+        # Views and WITHOUT ROWID tables have no rowid to probe
+        low = high = None
+
+    # Probing only pays off when the rowid range is much larger than the sample
+    if low is not None and high - low + 1 > 4 * n:
+        probe = f"SELECT * FROM {quoted} WHERE rowid = ?"
+        seen: set[int] = set()
+        rows = []
+        attempts = 0
+        while len(rows) < n and attempts < 20 * n:
+            attempts += 1
+            rowid = rng.randint(low, high)
+            if rowid in seen:
+                continue
+            seen.add(rowid)
+            row = conn.execute(probe, (rowid,)).fetchone()
+            if row is not None:
+                rows.append(row)
+        if len(rows) == n:
+            return rows, columns, "rowid"
+
+    # Reservoir sampling (Algorithm R) over one streaming pass, memory bounded by n
+    reservoir: list[tuple] = []
+    cursor = conn.execute(f"SELECT * FROM {quoted}")
+    seen_rows = 0
+    while batch := cursor.fetchmany(1000):
+        for row in batch:
+            seen_rows += 1
+            if len(reservoir) < n:
+                reservoir.append(row)
+            else:
+                slot = rng.randrange(seen_rows)
+                if slot < n:
+                    reservoir[slot] = row
+    return reservoir, columns, "reservoir"
+
+
+class ColumnSketch:
+    """Distinct count, quantile and heavy hitter sketches of one column, built in rowid order"""
+
+    def __init__(self, schema_version: int):
+        self.schema_version = schema_version
+        self.distinct = HyperLogLog()
+        self.quantiles = KLL(seed=0)
+        self.heavy = SpaceSaving()
+        self.rows = 0
+        self.nulls = 0
+        self.numeric = 0
+        self.minimum: float | None = None
+        self.maximum: float | None = None
+        # Rows up to last_rowid are folded in, so an interrupted pass resumes where it stopped
+        self.last_rowid: int | None = None
+        # The database's change token when the last pass completed
+        self.version: tuple | None = None
+        self.updated = datetime.now(timezone.utc)
+
+    def add(self, value: Any) -> None:
+        self.rows += 1
+        if value is None:
+            self.nulls += 1
+            return
+        self.distinct.add(value)
+        self.heavy.add(value)
+        # Quantiles and min/max only make sense over one ordered domain, so text and blobs are left out
+        if isinstance(value, (int, float)):
+            self.numeric += 1
+            self.quantiles.add(value)
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def summary(self, quantiles: list[float], top_k: int) -> dict[str, Any]:
+        non_null = self.rows - self.nulls
+        return {
+            "rows": self.rows,
+            "nulls": self.nulls,
+            "distinct": {
+                "estimate": min(self.distinct.count(), non_null),
+                "relative_error": round(self.distinct.relative_error, 4),
+            },
+            "numeric_values": self.numeric,
+            "min": self.minimum,
+            "max": self.maximum,
+            "quantiles": {
+                "values": {str(q): v for q, v in self.quantiles.quantiles(quantiles).items()} if self.numeric else {},
+                "rank_error": round(self.quantiles.rank_error, 4),
+            },
+            "heavy_hitters": {
+                "top": [
+                    {"value": _json_value(value), "count": count, "max_overcount": error}
+                    for value, count, error in self.heavy.top(top_k)
+                ],
+                "max_overcount": self.heavy.max_error,
+            },
+            "updated": self.updated.isoformat(),
+        }
+
+
+class SketchCache:
+    """Column sketches per (table, column), extended with rows past the last rowid seen instead of rescanning"""
+
+    def __init__(self, max_entries: int = 32, batch_rows: int = 5000):
+        self.max_entries = max_entries
+        self.batch_rows = batch_rows
+        self._sketches: OrderedDict[tuple[str, str], ColumnSketch] = OrderedDict()
+        # One pass at a time, so two callers never fold the same rows into a sketch twice
+        self._lock = threading.Lock()
+
+    def _store(self, key: tuple[str, str], sketch: ColumnSketch) -> None:
+        self._sketches[key] = sketch
+        self._sketches.move_to_end(key)
+        while len(self._sketches) > self.max_entries:
+            self._sketches.popitem(last=False)
+
+    def sketch(
+        self, conn: sqlite3.Connection, table: str, column: str, rebuild: bool = False, version: tuple | None = None
+    ) -> tuple[ColumnSketch, str, int]:
+        """Returns the column's sketch, how it was brought up to date ("full", "incremental" or "cached") and rows added.
+
+        `version` identifies the database's state (write generation and data_version, read before `conn` is used).
+        While it is unchanged a cached sketch is returned as is; otherwise deletes are looked for with a COUNT(*)
+        over the rows already sketched, which walks the table, before new rows are appended.
+        """
+        quoted_table, quoted_column = _quote_identifier(table), _quote_identifier(column)
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        key = (table, column)
+        with self._lock:
+            sketch = self._sketches.get(key)
+            try:
+                conn.execute(f"SELECT rowid FROM {quoted_table} LIMIT 0")
+            except sqlite3.OperationalError:
+                # WITHOUT ROWID tables cannot be resumed, so they are rescanned on every call
+                sketch = ColumnSketch(schema_version)
+                cursor = conn.execute(f"SELECT {quoted_column} FROM {quoted_table}")
+                while batch := cursor.fetchmany(self.batch_rows):
+                    for (value,) in batch:
+                        sketch.add(value)
+                return sketch, "full", sketch.rows
+
+            if sketch is not None and version is not None and sketch.version == version and not rebuild:
+                self._sketches.move_to_end(key)
+                return sketch, "cached", 0
+            if sketch is not None and sketch.last_rowid is not None and not rebuild:
+                # Deleted rows can't be taken out of a sketch; notice them and start over
+                (kept,) = conn.execute(
+                    f"SELECT COUNT(*) FROM {quoted_table} WHERE rowid <= ?", (sketch.last_rowid,)
+                ).fetchone()
+                if kept != sketch.rows:
+                    sketch = None
+            if rebuild or sketch is None or sketch.schema_version != schema_version:
+                sketch = ColumnSketch(schema_version)
+            mode = "full" if sketch.last_rowid is None else "incremental"
+            self._store(key, sketch)
+
+            before = sketch.rows
+            cursor = conn.execute(
+                f"SELECT rowid, {quoted_column} FROM {quoted_table} WHERE rowid > ? ORDER BY rowid",
+                (sketch.last_rowid if sketch.last_rowid is not None else -(1 << 63),),
+            )
+            while batch := cursor.fetchmany(self.batch_rows):
+                for rowid, value in batch:
+                    sketch.add(value)
+                    sketch.last_rowid = rowid
+                sketch.updated = datetime.now(timezone.utc)
+            sketch.version = version
+            return sketch, mode, sketch.rows - before
+
+
+def _page_cache_bytes(profile: str) -> int:
+    # cache_size is in KiB when negative and in pages when positive; SQLite's default is -2000
+    cache_size = int(PROFILES[profile].get("cache_size", -2000))
+    return -cache_size * 1024 if cache_size < 0 else cache_size * 4096
+
+
+class Tenant:
+    """One database file with everything the server keeps for it: connections, cursors, caches and workload"""
+
+    def __init__(self, name: str, path: str, profile: str):
+        self.name = name
+        self.path = path
+        self.db = Database(path, POOL_SIZE, profile)
+        self.cursors = CursorRegistry(self.db, CURSOR_IDLE_SECONDS, self.db.readers.size - 1)
+        self.result_cache = ResultCache(self.db, CACHE_BYTES, CACHE_RECHECK_SECONDS)
+        self.schema_cache = SchemaCache(self.db)
+        self.workload = WorkloadLog()
+        self.stats_maintainer = StatsMaintainer(self.db, ANALYZE_INTERVAL_SECONDS, ANALYSIS_LIMIT, ANALYZE_DRIFT)
+        self.sketches = SketchCache()
+        self.snapshots = SnapshotReplicas(self.db, SNAPSHOT_REFRESH_SECONDS, SNAPSHOT_DIR, POOL_SIZE)
+        # Calls currently using this database; it is never closed while non-zero
+        self.users = 0
+
+    def file_descriptors(self) -> int:
+        # The database file, its -wal and its -shm per open connection, and just the file for snapshot readers
+        return 3 * self.db.open_connections() + self.snapshots.open_connections()
+
+    def memory_bytes(self) -> int:
+        connections = self.db.open_connections() + self.snapshots.open_connections()
+        return self.result_cache.stats()["bytes"] + connections * _page_cache_bytes(self.db.profile)
+
+    def idle(self) -> bool:
+        return self.users == 0 and len(self.cursors) == 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "database": self.name,
+            "path": self.path,
+            "connections": self.db.open_connections(),
+            "file_descriptors": self.file_descriptors(),
+            "memory_bytes": self.memory_bytes(),
+            "open_cursors": len(self.cursors),
+            "active_calls": self.users,
+            "snapshot_age_seconds": round(age, 1) if (age := self.snapshots.age()) is not None else None,
+        }
+
+    def close(self) -> None:
+        self.stats_maintainer.stop()
+        self.cursors.close_all()
+        self.snapshots.stop()
+        self.db.close()
+
+
+class UnknownDatabaseError(LookupError):
+    def __str__(self) -> str:
+        return f"Unknown database: {self.args[0]}"
+
+
+# Identifiers double as file names in SQLITE_DATABASE_DIR, so no path separators or leading dots
+_DATABASE_ID_RE = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]*")
+
+
+def _is_database_id(name: str) -> bool:
+    # Snapshot copies are never databases in their own right, even where an old version left them next to one
+    return bool(_DATABASE_ID_RE.fullmatch(name)) and not _SNAPSHOT_NAME_RE.search(name)
+
+
+class DatabaseRegistry:
+    """Maps database identifiers to files and keeps an LRU of open ones within count, descriptor and memory budgets"""
+
+    def __init__(
+        self,
+        default_path: str,
+        registry_file: str | None,
+        directory: str | None,
+        max_open: int,
+        fd_budget: int,
+        memory_budget: int,
+        profile: str,
+        sweep_seconds: float = 30.0,
+    ):
+        self.default_path = default_path
+        self.registry_file = Path(registry_file).expanduser() if registry_file else None
+        self.directory = Path(directory).expanduser() if directory else None
+        self.max_open = max(1, max_open)
+        self.fd_budget = fd_budget
+        self.memory_budget = memory_budget
+        self.profile = profile
+        self._open: OrderedDict[str, Tenant] = OrderedDict()
+        self._lock = threading.Lock()
+        self._mapping: dict[str, str] = {}
+        self._mapping_mtime: float | None = None
+        self.evictions = 0
+        self.sweep_seconds = sweep_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _registered(self) -> dict[str, str]:
+        # Re-read the registry file whenever it changes, so tenants can be added without a restart
+        if self.registry_file is None:
+            return {}
+        mtime = self.registry_file.stat().st_mtime
+        if mtime != self._mapping_mtime:
+            entries = json.loads(self.registry_file.read_text())
+            base = self.registry_file.parent
+            self._mapping = {name: str(base / Path(path).expanduser()) for name, path in entries.items()}
+            self._mapping_mtime = mtime
+        return self._mapping
+
+    def resolve(self, name: str) -> str:
+        registered = self._registered()
+        if name in registered:
+            return registered[name]
+        if name == DEFAULT_DATABASE:
+            return self.default_path
+        if self.directory is not None and _is_database_id(name):
+            candidate = self.directory / f"{name}.db"
+            if candidate.is_file():
+                return str(candidate)
+        raise UnknownDatabaseError(name)
+
+    def names(self) -> list[str]:
+        names = {DEFAULT_DATABASE, *self._registered()}
+        if self.directory is not None:
+            names.update(p.stem for p in self.directory.glob("*.db") if _is_database_id(p.stem))
+        return sorted(names)
+
+    def _over_budget(self) -> bool:
+        tenants = list(self._open.values())
+        return (
+            len(tenants) > self.max_open
+            or sum(t.file_descriptors() for t in tenants) > self.fd_budget
+            or sum(t.memory_bytes() for t in tenants) > self.memory_budget
+        )
+
+    def _evict(self) -> None:
+        victims = []
+        with self._lock:
+            while self._over_budget():
+                # Oldest first; databases in use or holding cursors stay open even if that means running over budget
+                name = next((n for n, t in self._open.items() if t.idle()), None)
+                if name is None:
+                    break
+                victims.append(self._open.pop(name))
+        for tenant in victims:
+            self.evictions += 1
+            logger.info(f"Closing idle database {tenant.name} to stay within open database budgets")
+            # Closing joins the ANALYZE thread and runs PRAGMA optimize, so keep it off the caller's path
+            threading.Thread(target=tenant.close, name="sqlite-close", daemon=True).start()
+
+    @contextmanager
+    def use(self, name: str | None = None) -> Iterator[Tenant]:
+        """Opens (or reuses) a database by identifier and keeps it open until the block ends"""
+        name = name or DEFAULT_DATABASE
+        with self._lock:
+            tenant = self._open.get(name)
+            if tenant is None:
+                tenant = Tenant(name, self.resolve(name), self.profile)
+                tenant.stats_maintainer.start()
+                tenant.snapshots.start()
+                self._open[name] = tenant
+            self._open.move_to_end(name)
+            tenant.users += 1
+        try:
+            yield tenant
+        finally:
+            with self._lock:
+                tenant.users -= 1
+            self._evict()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            tenants = [t.stats() for t in reversed(self._open.values())]
+        return {
+            "open": tenants,
+            "available": self.names(),
+            "evictions": self.evictions,
+            "budgets": {"max_open": self.max_open, "file_descriptors": self.fd_budget, "memory_bytes": self.memory_budget},
+        }
+
+    def _sweep(self) -> None:
+        while not self._stop.wait(self.sweep_seconds):
+            # An abandoned cursor pins a reader and its WAL read mark, which stops checkpoints from
+            # resetting the WAL, so idle cursors are closed on a timer rather than on the next call
+            with self._lock:
+                tenants = list(self._open.values())
+            for tenant in tenants:
+                tenant.cursors.expire()
+            self._evict()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sweep, name="sqlite-cursor-sweep", daemon=True)
+            self._thread.start()
+
+    def close_all(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            tenants = list(self._open.values())
+            self._open.clear()
+        for tenant in tenants:
+            tenant.close()
+
+
+registry = DatabaseRegistry(
+    DB_PATH,
+    DATABASE_REGISTRY,
+    DATABASE_DIR,
+    MAX_OPEN_DATABASES,
+    OPEN_FD_BUDGET,
+    OPEN_MEMORY_BUDGET,
+    PROFILE,
+    # Idle cursors are closed within a quarter of their idle timeout (at most 30 s) of expiring
+    sweep_seconds=min(30.0, max(1.0, CURSOR_IDLE_SECONDS / 4)),
+)
+executor = SQLExecutor(WORKERS)
+slow_log = SlowQueryLog(SLOW_LOG_PATH, SLOW_QUERY_MS, SLOW_LOG_MAX_BYTES, SLOW_LOG_BACKUPS)
+query_metrics = QueryMetrics()
+metrics_exporter = MetricsExporter(query_metrics, METRICS_FILE, METRICS_PORT, METRICS_INTERVAL_SECONDS)
+
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    logger.info(
+        f"Serving {DB_PATH} in WAL mode with {POOL_SIZE} reader connections per database, {executor.workers} workers "
+        f"and the {registry.profile} profile"
+    )
+    if registry.registry_file or registry.directory:
+        logger.info(f"Databases available by identifier: {', '.join(registry.names())}")
+    registry.start()
+    metrics_exporter.start()
+    try:
+        yield
+    finally:
+        metrics_exporter.stop()
+        executor.shutdown()
+        registry.close_all()
+
+
 # Create an MCP server instance
-mcp = FastMCP("SQLite SQL Assistant")
+mcp = FastMCP("SQLite SQL Assistant", lifespan=server_lifespan)
+
+def _run_sql(
+    tenant: Tenant,
+    sql: str,
+    page_rows: int,
+    budget: QueryBudget,
+    trace: QueryTrace,
+    max_staleness: float | None = None,
+) -> tuple[list[tuple], list[str], str | None]:
+    """Runs a statement and returns its first page of rows, column names and a cursor token if more rows remain.
+
+    Reads go to a snapshot no older than `max_staleness` seconds when one exists, otherwise to the database.
+    """
+    with trace.phase("parse"):
+        is_read = is_read_statement(sql)
+        fingerprint = normalize_sql(sql) if is_read else None
+    if is_read:
+        cacheable = tenant.result_cache.cacheable(fingerprint)
+        if cacheable:
+            generation = tenant.result_cache.generation()
+            cached = tenant.result_cache.get(fingerprint, page_rows)
+            if cached is not None:
+                trace.cache_hit = True
+                return cached[0], cached[1], None
+        with trace.phase("connection_wait"):
+            # The result cache is always current, so it is checked before any snapshot
+            routed = tenant.snapshots.acquire(max_staleness) if max_staleness is not None else None
+            source, conn = routed if routed is not None else (tenant.db, tenant.db.acquire_reader())
+        if routed is not None:
+            trace.snapshot_age = source.age
+        started = time.perf_counter()
+        try:
+            with budget.applied(conn):
+                with trace.phase("exec"):
+                    cursor = conn.execute(sql)
+                with trace.phase("fetch"):
+                    rows = cursor.fetchmany(page_rows + 1)
+        except sqlite3.OperationalError as e:
+            source.release_reader(conn)
+            # Misclassified write (e.g. WITH ... DELETE); fall through to the writer
+            if not _is_readonly_error(e):
+                raise
+        except BaseException:
+            source.release_reader(conn)
+            raise
+        else:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            tenant.workload.record(sql, elapsed_ms, fingerprint=fingerprint)
+            if slow_log.is_slow(elapsed_ms):
+                slow_log.record(conn, tenant.name, sql, elapsed_ms, min(len(rows), page_rows), budget.steps)
+            columns = _column_names(cursor)
+            if len(rows) <= page_rows:
+                cursor.close()
+                source.release_reader(conn)
+                if cacheable and routed is None:
+                    tenant.result_cache.put(fingerprint, rows, columns, generation)
+                return rows, columns, None
+            # Keep the statement open on its reader so later pages stream with fetchmany
+            token = tenant.cursors.open(conn, cursor, rows.pop(), len(rows), source)
+            return rows, columns, token
+    waiting = time.perf_counter()
+    with tenant.db.writer() as conn, budget.applied(conn):
+        trace.timings["connection_wait"] = time.perf_counter() - waiting
+        started = time.perf_counter()
+        with trace.phase("exec"):
+            cursor = conn.execute(sql)
+        with trace.phase("fetch"):
+            rows = cursor.fetchall()
+        conn.commit()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        tenant.workload.record(sql, elapsed_ms)
+        if slow_log.is_slow(elapsed_ms):
+            slow_log.record(conn, tenant.name, sql, elapsed_ms, len(rows), budget.steps)
+        return rows, _column_names(cursor), None
+
+def _column_names(cursor: sqlite3.Cursor) -> list[str]:
+    return [col[0] for col in cursor.description] if cursor.description else []
+
+
+def _storage_class(values: list[Any]) -> str:
+    """Infers a column's SQLite storage class from the values on this page"""
+    kinds = {type(v) for v in values if v is not None}
+    if not kinds:
+        return "NULL"
+    if kinds == {int}:
+        return "INTEGER"
+    if kinds <= {int, float}:
+        return "REAL"
+    if kinds == {bytes}:
+        return "BLOB"
+    return "TEXT"
+
+
+def _json_value(value: Any) -> Any:
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def _format_page(
+    rows: list[tuple],
+    columns: list[str],
+    token: str | None,
+    first_row: int,
+    output_format: OutputFormat = "text",
+) -> str:
+    last_row = first_row + len(rows) - 1
+
+    if output_format == "columnar":
+        # Column-major arrays: repeated values compress well and map straight onto a DataFrame
+        raw = list(zip(*rows)) if rows else [() for _ in columns]
+        data = [[_json_value(v) for v in col] for col in raw]
+        result: dict[str, Any] = {
+            "columns": columns,
+            # Typed from the raw values: BLOBs are already hex strings in `data`
+            "types": [_storage_class(col) for col in raw],
+            "data": data,
+            "rows": len(rows),
+            "first_row": first_row,
+        }
+        if token is not None:
+            result["cursor"] = token
+        return json.dumps(result, separators=(",", ":"), default=str)
+
+    if output_format in ("csv", "tsv"):
+        buf = io.StringIO()
+        writer = csv.writer(buf, delimiter="," if output_format == "csv" else "\t", lineterminator="\n")
+        if first_row == 1:
+            writer.writerow(columns)
+        writer.writerows([_json_value(v) for v in row] for row in rows)
+        if token is not None:
+            buf.write(f"# rows {first_row}-{last_row} shown, more available: call fetch_more with cursor=\"{token}\"\n")
+        return buf.getvalue().rstrip("\n")
+
+    text = "\n".join(str(row) for row in rows)
+    if token is not None:
+        text += f"\n… rows {first_row}-{last_row} shown, more available: call fetch_more with cursor=\"{token}\""
+    return text
+
+
+@mcp.tool()
+async def query_data(
+    sql: str,
+    page_rows: int = PAGE_ROWS,
+    output_format: OutputFormat = "text",
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+    max_staleness_seconds: float | None = None,
+) -> str:
+    """Executes raw SQL on the local SQLite database.
+
+    Large results are paginated: the first `page_rows` rows are returned together
+    with a cursor token that can be passed to `fetch_more` for the next page.
+
+    `output_format` selects how rows are rendered: "text" (one tuple per line),
+    "columnar" (JSON with column names, types and column-major data arrays),
+    or "csv"/"tsv" with a header row.
+
+    Statements running longer than `timeout_ms` are aborted (0 means no limit).
+    `database` selects a registered database by identifier (see `list_databases`).
+
+    Reads that can tolerate data up to `max_staleness_seconds` old may be served from a
+    snapshot copy instead, which keeps long aggregations off the live database file.
+    """
+    budget = QueryBudget(timeout_ms)
+    trace = QueryTrace()
+    started = time.perf_counter()
+    try:
+        with registry.use(database) as tenant:
+            rows, columns, token = await executor.run(
+                budget, _run_sql, tenant, sql, max(1, page_rows), budget, trace, max_staleness_seconds
+            )
+
+        # Return query result or a success message
+        with trace.phase("serialise"):
+            if not rows and (output_format == "text" or not columns):
+                result = "✅ Query ran successfully."
+            else:
+                result = _format_page(rows, columns, token, 1, output_format)
+            if trace.snapshot_age is not None and output_format == "text":
+                result += f"\n… served from a snapshot taken {trace.snapshot_age:.0f} s ago"
+        trace.rows = len(rows)
+        trace.bytes = len(result.encode())
+        return result
+    except Exception as e:
+        trace.error = True
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ SQL Error: {e}"
+    finally:
+        trace.timings["total"] = time.perf_counter() - started
+        query_metrics.observe(trace)
+
+def _fetch_page(server_cursor: ServerCursor, page_rows: int, budget: QueryBudget) -> tuple[int, list[str], list[tuple], bool]:
+    with server_cursor.lock:
+        if server_cursor.closed:
+            raise CursorExpiredError
+        with budget.applied(server_cursor.conn):
+            first_row = server_cursor.rows_sent + 1
+            columns = _column_names(server_cursor.cursor)
+            rows, more = server_cursor.fetch_page(page_rows)
+    return first_row, columns, rows, more
+
+
+@mcp.tool()
+async def fetch_more(
+    cursor: str,
+    page_rows: int = PAGE_ROWS,
+    output_format: OutputFormat = "text",
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+) -> str:
+    """Fetches the next page of rows for a cursor returned by `query_data` (on the same `database`)"""
+    try:
+        with registry.use(database) as tenant:
+            server_cursor = tenant.cursors.get(cursor)
+            if server_cursor is None:
+                return "❌ Unknown or expired cursor, re-run the query."
+            budget = QueryBudget(timeout_ms)
+            try:
+                first_row, columns, rows, more = await executor.run(
+                    budget, _fetch_page, server_cursor, max(1, page_rows), budget
+                )
+            except CursorExpiredError:
+                return "❌ Unknown or expired cursor, re-run the query."
+            except Exception as e:
+                tenant.cursors.close(cursor)
+                if budget.stopped:
+                    return budget.describe()
+                return f"❌ SQL Error: {e}"
+            if not more:
+                tenant.cursors.close(cursor)
+    except UnknownDatabaseError as e:
+        return f"❌ {e}"
+    if not rows:
+        return "✅ No more rows."
+    return _format_page(rows, columns, cursor if more else None, first_row, output_format)
+
+
+@mcp.tool()
+async def close_cursor(cursor: str, database: str | None = None) -> str:
+    """Releases a cursor returned by `query_data` without reading the remaining rows"""
+    try:
+        with registry.use(database) as tenant:
+            # Waits for the cursor's lock, which a page being fetched holds
+            closed = await executor.run(QueryBudget(0), tenant.cursors.close, cursor)
+    except UnknownDatabaseError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    return "✅ Cursor closed." if closed else "❌ Unknown or expired cursor."
+
+
+class BatchStatement(BaseModel):
+    sql: str
+    params: list[Any] | dict[str, Any] | None = None
+
+
+class _ReadOnlyBatch(Exception):
+    """Raised when a batch routed to a reader turns out to write"""
+
+
+def _run_batch_on(
+    tenant: Tenant,
+    conn: sqlite3.Connection,
+    statements: list[BatchStatement],
+    page_rows: int,
+    transaction: bool,
+    writer: bool,
+) -> list[dict[str, Any]]:
+    results = []
+    if transaction:
+        conn.execute("BEGIN")
+    try:
+        for n, stmt in enumerate(statements, 1):
+            started = time.perf_counter()
+            result: dict[str, Any] = {"sql": stmt.sql}
+            try:
+                cursor = conn.execute(stmt.sql, stmt.params if stmt.params is not None else ())
+                rows = cursor.fetchmany(page_rows + 1)
+                tenant.workload.record(stmt.sql, (time.perf_counter() - started) * 1000, stmt.params)
+                result["truncated"] = len(rows) > page_rows
+                result["rows"] = rows[:page_rows]
+                result["columns"] = _column_names(cursor)
+                cursor.close()
+                if writer and not transaction:
+                    conn.commit()
+            except sqlite3.Error as e:
+                if not writer and _is_readonly_error(e):
+                    raise _ReadOnlyBatch() from e
+                # Inside a transaction one failure aborts the whole batch
+                if transaction:
+                    raise type(e)(f"statement {n} rolled back the batch: {e}") from e
+                if writer and conn.in_transaction:
+                    conn.rollback()
+                result["error"] = str(e)
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            results.append(result)
+        if transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return results
+
+
+def _run_batch(
+    tenant: Tenant, statements: list[BatchStatement], page_rows: int, transaction: bool, budget: QueryBudget
+) -> list[dict[str, Any]]:
+    """Runs all statements on one connection: a reader if they all read, otherwise the writer"""
+    if all(is_read_statement(stmt.sql) for stmt in statements):
+        try:
+            with tenant.db.reader() as conn, budget.applied(conn):
+                return _run_batch_on(tenant, conn, statements, page_rows, transaction, writer=False)
+        except _ReadOnlyBatch:
+            pass
+    with tenant.db.writer() as conn, budget.applied(conn):
+        return _run_batch_on(tenant, conn, statements, page_rows, transaction, writer=True)
+
+
+def _format_batch(results: list[dict[str, Any]], output_format: OutputFormat) -> str:
+    if output_format == "columnar":
+        payload = []
+        for i, result in enumerate(results, 1):
+            item: dict[str, Any] = {"statement": i, "elapsed_ms": result["elapsed_ms"]}
+            if "error" in result:
+                item["error"] = result["error"]
+            else:
+                item.update(json.loads(_format_page(result["rows"], result["columns"], None, 1, "columnar")))
+                item["truncated"] = result["truncated"]
+            payload.append(item)
+        return json.dumps(payload, separators=(",", ":"), default=str)
+
+    blocks = []
+    for i, result in enumerate(results, 1):
+        if "error" in result:
+            blocks.append(f"-- [{i}] {result['elapsed_ms']} ms\n❌ SQL Error: {result['error']}")
+            continue
+        header = f"-- [{i}] {result['elapsed_ms']} ms, {len(result['rows'])} rows"
+        if result["truncated"]:
+            header += " (truncated, use query_data to page through the rest)"
+        body = _format_page(result["rows"], result["columns"], None, 1, output_format) if result["rows"] else "✅ Query ran successfully."
+        blocks.append(f"{header}\n{body}")
+    return "\n\n".join(blocks)
+
+
+@mcp.tool()
+async def query_batch(
+    statements: list[BatchStatement],
+    transaction: bool = False,
+    page_rows: int = PAGE_ROWS,
+    output_format: OutputFormat = "text",
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+) -> str:
+    """Executes several SQL statements in one call on a single connection.
+
+    Each statement may carry `params` for `?` or `:name` placeholders. With
+    `transaction` set, reads share one consistent snapshot and writes are
+    all-or-nothing. Each result is capped at `page_rows` rows and reports its
+    own timing.
+    """
+    if not statements:
+        return "❌ No statements given."
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            results = await executor.run(budget, _run_batch, tenant, statements, max(1, page_rows), transaction, budget)
+    except Exception as e:
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ SQL Error: {e}"
+    return _format_batch(results, output_format)
+
+
+def _explain(tenant: Tenant, sql: str, params: list[Any] | dict[str, Any] | None, budget: QueryBudget) -> dict[str, Any]:
+    with tenant.db.reader() as conn, budget.applied(conn):
+        return analyze_plan(conn, sql, query_plan(conn, sql, params))
+
+
+@mcp.tool()
+async def explain_query(
+    sql: str,
+    params: list[Any] | dict[str, Any] | None = None,
+    output_format: Literal["text", "json"] = "text",
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+) -> str:
+    """Shows the EXPLAIN QUERY PLAN tree for a statement without running it.
+
+    Full table scans and temporary B-tree sorts are flagged, and rows touched
+    are estimated from sqlite_stat1 (or a cheap approximation when the
+    database has not been analyzed). Check expensive queries here first.
+    """
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            analysis = await executor.run(budget, _explain, tenant, sql, params, budget)
+    except Exception as e:
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ SQL Error: {e}"
+    return json.dumps(analysis) if output_format == "json" else format_plan(analysis)
+
+
+def _advise(tenant: Tenant, budget: QueryBudget) -> list[dict[str, Any]]:
+    statements = tenant.workload.snapshot()
+    # The slow query log outlives restarts, so its offenders are replayed too
+    seen = {entry["fingerprint"] for entry in statements}
+    for offender in slow_log.offenders(database=tenant.name):
+        fingerprint = normalize_sql(offender["sql"])
+        if fingerprint not in seen:
+            seen.add(fingerprint)
+            statements.append({"sql": offender["sql"], "params": offender["params"], "count": offender["count"], "fingerprint": fingerprint})
+    with tenant.db.reader() as conn, budget.applied(conn):
+        return advise_indexes(conn, statements)
+
 
 @mcp.tool()
-def query_data(sql: str) -> str:
-    """Executes raw SQL on the local SQLite database"""
+async def index_advice(timeout_ms: int = QUERY_TIMEOUT_MS, database: str | None = None) -> str:
+    """Proposes indexes for full table scans seen in recently executed statements.
+
+    Each proposal lists its CREATE INDEX statement, whether it is covering, the
+    estimated rows saved across the recorded workload and the statements it helps.
+    Nothing is created; use `apply_index_advice` for that.
+    """
+    budget = QueryBudget(timeout_ms)
     try:
-        conn = sqlite3.connect("database.db")
-        cursor = conn.cursor()
-        cursor.execute(sql)
+        with registry.use(database) as tenant:
+            proposals = await executor.run(budget, _advise, tenant, budget)
+    except Exception as e:
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ SQL Error: {e}"
+    if not proposals:
+        return "✅ No index suggestions for the recorded workload."
+    return json.dumps(proposals, indent=1)
+
 
-        rows = cursor.fetchall()
+def _apply_indexes(tenant: Tenant, names: list[str] | None, budget: QueryBudget) -> list[str]:
+    # Same proposals as index_advice, including those from the slow query log
+    proposals = _advise(tenant, budget)
+    chosen = [p for p in proposals if names is None or p["name"] in names]
+    created = []
+    with tenant.db.writer() as conn, budget.applied(conn):
+        for proposal in chosen:
+            conn.execute(proposal["sql"])
+            created.append(proposal["name"])
+        if created:
+            conn.execute("ANALYZE")
         conn.commit()
+    if created:
+        tenant.stats_maintainer.mark_analyzed()
+    return created
 
-        # Return query result or a success message
-        return "\n".join(str(row) for row in rows) if rows else "✅ Query ran successfully."
+
+@mcp.tool()
+async def apply_index_advice(
+    index_names: list[str] | None = None, timeout_ms: int = 0, database: str | None = None
+) -> str:
+    """Admin: creates indexes proposed by `index_advice` and refreshes planner statistics with ANALYZE.
+
+    Pass `index_names` to create only some proposals; omit it to create all of them.
+    """
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            created = await executor.run(budget, _apply_indexes, tenant, index_names, budget)
     except Exception as e:
+        if budget.stopped:
+            return budget.describe()
         return f"❌ SQL Error: {e}"
+    if not created:
+        return "✅ No matching index proposals, nothing created."
+    return "✅ Created " + ", ".join(created) + " and ran ANALYZE."
+
+
+def _import(
+    tenant: Tenant,
+    path: Path,
+    table: str,
+    file_format: str,
+    batch_size: int,
+    on_conflict: str,
+    drop_indexes: bool,
+    budget: QueryBudget,
+) -> dict[str, Any]:
+    with tenant.db.writer() as conn, budget.applied(conn):
+        return import_file(conn, path, table, file_format, batch_size, on_conflict, drop_indexes)
+
+
+@mcp.tool()
+async def import_rows(
+    path: str,
+    table: str,
+    file_format: Literal["csv", "jsonl"] | None = None,
+    batch_size: int = 10000,
+    on_conflict: Literal["abort", "ignore", "replace"] = "abort",
+    drop_indexes: bool = False,
+    timeout_ms: int = 0,
+    database: str | None = None,
+) -> str:
+    """Bulk-loads a local CSV (with header row) or JSONL file into an existing table.
+
+    Rows are inserted with executemany and committed every `batch_size` rows;
+    values are coerced to the column types of the table. With `drop_indexes`
+    the table's non-unique indexes are dropped for the load and rebuilt
+    afterwards, which is faster for large imports.
+    """
+    source = Path(path).expanduser()
+    if not source.is_file():
+        return f"❌ File not found: {path}"
+    file_format = file_format or ("jsonl" if source.suffix.lower() in (".jsonl", ".ndjson", ".json") else "csv")
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            report = await executor.run(
+                budget, _import, tenant, source, table, file_format, max(1, batch_size), on_conflict, drop_indexes, budget
+            )
+    except Exception as e:
+        if budget.stopped:
+            committed = f"; {e.rows} rows in {e.batches} batches were already committed" if isinstance(e, PartialImportError) else ""
+            return budget.describe() + committed
+        return f"❌ Import Error: {e}"
+    summary = (
+        f"✅ Imported {report['rows']} rows into {table} in {report['seconds']} s "
+        f"({report['rows_per_second']} rows/s, {report['batches']} batches)"
+    )
+    if report.get("rebuilt_indexes"):
+        summary += f", rebuilt {report['rebuilt_indexes']} indexes"
+    if report["ignored_columns"]:
+        summary += f"; ignored columns not in {table}: {', '.join(report['ignored_columns'])}"
+    return summary
+
+
+def _export(
+    tenant: Tenant,
+    sql: str,
+    params: list[Any] | dict[str, Any] | None,
+    target: Path,
+    file_format: str,
+    batch_size: int,
+    budget: QueryBudget,
+    max_staleness: float | None = None,
+) -> int:
+    # Write next to the target and rename at the end, so a failed export never leaves a half-written file
+    partial = target.with_name(target.name + ".part")
+    routed = tenant.snapshots.acquire(max_staleness) if max_staleness is not None else None
+    source, conn = routed if routed is not None else (tenant.db, tenant.db.acquire_reader())
+    try:
+        with budget.applied(conn):
+            cursor = conn.execute(sql, params if params is not None else ())
+            total = export_rows(cursor, partial, file_format, batch_size)
+            cursor.close()
+        os.replace(partial, target)
     finally:
-        conn.close()
+        source.release_reader(conn)
+        partial.unlink(missing_ok=True)
+    return total
+
+
+@mcp.tool()
+async def export_query(
+    sql: str,
+    path: str,
+    file_format: Literal["csv", "jsonl", "parquet"] | None = None,
+    params: list[Any] | dict[str, Any] | None = None,
+    batch_size: int = 10000,
+    overwrite: bool = False,
+    timeout_ms: int = 0,
+    database: str | None = None,
+    max_staleness_seconds: float | None = None,
+) -> str:
+    """Runs a read query and streams its rows to a local CSV, JSONL or Parquet file.
+
+    Rows never pass through the conversation: only the path, row count, file
+    size and elapsed time are returned. Use this for large extracts. With
+    `max_staleness_seconds` the rows may come from a snapshot copy that old.
+    """
+    if not is_read_statement(sql):
+        return "❌ export_query only runs read statements."
+    target = Path(path).expanduser()
+    if target.exists() and not overwrite:
+        return f"❌ {path} already exists, pass overwrite=true to replace it."
+    suffix = target.suffix.lower()
+    file_format = file_format or ("parquet" if suffix == ".parquet" else "jsonl" if suffix in (".jsonl", ".ndjson") else "csv")
+    budget = QueryBudget(timeout_ms)
+    started = time.perf_counter()
+    try:
+        with registry.use(database) as tenant:
+            total = await executor.run(
+                budget, _export, tenant, sql, params, target, file_format, max(1, batch_size), budget, max_staleness_seconds
+            )
+    except Exception as e:
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ Export Error: {e}"
+    elapsed = time.perf_counter() - started
+    return json.dumps({
+        "path": str(target.resolve()),
+        "format": file_format,
+        "rows": total,
+        "bytes": target.stat().st_size,
+        "seconds": round(elapsed, 3),
+    })
+
+
+def _planner_stats(tenant: Tenant, refresh: bool) -> dict[str, Any]:
+    maintainer = tenant.stats_maintainer
+    analyzed = maintainer.refresh(force=True) if refresh else []
+    last_check = maintainer.last_check
+    return {
+        "analyzed_now": analyzed,
+        "last_background_check": last_check.isoformat() if last_check else None,
+        "interval_seconds": maintainer.interval,
+        "tables": maintainer.table_status(),
+    }
+
+
+@mcp.tool()
+async def planner_stats(refresh: bool = False, database: str | None = None) -> str:
+    """Reports when planner statistics (sqlite_stat1) were last refreshed and how far each table has drifted.
+
+    Pass `refresh` to run ANALYZE on every table now.
+    """
+    budget = QueryBudget(0)
+    try:
+        with registry.use(database) as tenant:
+            report = await executor.run(budget, _planner_stats, tenant, refresh)
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    return json.dumps(report, indent=1)
+
+
+def _summary_report(
+    tenant: Tenant, report: str, month: str | None, limit: int, budget: QueryBudget
+) -> tuple[list[tuple], list[str], bool]:
+    with tenant.db.reader() as conn, budget.applied(conn):
+        cursor, installed = summary_report(conn, report, month, limit)
+        return cursor.fetchall(), _column_names(cursor), installed
+
+
+@mcp.tool()
+async def purchase_summary(
+    report: Literal["revenue_per_user", "top_skus", "sales_by_day", "sales_by_month", "spend_by_category"],
+    month: str | None = None,
+    limit: int = 20,
+    output_format: OutputFormat = "text",
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+) -> str:
+    """Answers common purchase analytics from pre-aggregated summary tables in constant time.
+
+    Reports: revenue_per_user, top_skus, sales_by_day, sales_by_month and
+    spend_by_category. `month` ("YYYY-MM") restricts the month-based reports.
+    Prefer this over aggregating purchase_orders with query_data.
+    """
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            rows, columns, installed = await executor.run(
+                budget, _summary_report, tenant, report, month, max(1, limit), budget
+            )
+    except Exception as e:
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ SQL Error: {e}"
+    if not rows:
+        return "✅ No matching purchases."
+    result = _format_page(rows, columns, None, 1, output_format)
+    if not installed and output_format == "text":
+        result += "\n… computed from purchase_orders; run install_purchase_summaries to make this constant time"
+    return result
+
+
+def _install_summaries(tenant: Tenant, rebuild: bool) -> list[str]:
+    with tenant.db.writer() as conn:
+        return create_purchase_summaries(conn, rebuild)
+
+
+@mcp.tool()
+async def install_purchase_summaries(rebuild: bool = False, database: str | None = None) -> str:
+    """Admin: creates trigger-maintained summary tables over purchase_orders (per user, SKU/month and day).
+
+    Existing summaries are kept unless `rebuild` is set, which recomputes them from scratch.
+    """
+    budget = QueryBudget(0)
+    try:
+        with registry.use(database) as tenant:
+            created = await executor.run(budget, _install_summaries, tenant, rebuild)
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    if not created:
+        return "✅ Purchase summaries already installed; triggers are in place."
+    return "✅ Created and backfilled " + ", ".join(created) + "."
+
+
+def _search_products(
+    tenant: Tenant, text: str, source: str, limit: int, raw: bool, budget: QueryBudget
+) -> tuple[list[tuple], list[str], bool]:
+    with tenant.db.reader() as conn, budget.applied(conn):
+        cursor, installed = search_products_in(conn, text, source, limit, raw)
+        return cursor.fetchall(), _column_names(cursor), installed
+
+
+@mcp.tool()
+async def search_products(
+    query: str,
+    source: Literal["all", "sku", "inventory"] = "all",
+    limit: int = 10,
+    raw_fts: bool = False,
+    output_format: OutputFormat = "text",
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+) -> str:
+    """Full-text search over SKU and inventory names, descriptions and categories, best matches first.
+
+    Every word in `query` must match (as a prefix, with stemming). Set
+    `raw_fts` to pass an FTS5 query (OR, NEAR, "phrases") through unchanged.
+    purchase_orders rows can be found by joining the returned sku_name values.
+    Use this instead of LIKE '%...%' scans.
+    """
+    if not re.search(r"\w", query):
+        return "❌ Empty search query."
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            rows, columns, installed = await executor.run(
+                budget, _search_products, tenant, query, source, max(1, limit), raw_fts, budget
+            )
+    except Exception as e:
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ SQL Error: {e}"
+    if not rows:
+        return "✅ No matching products."
+    result = _format_page(rows, columns, None, 1, output_format)
+    if not installed and output_format == "text":
+        result += "\n… unranked LIKE scan; run install_product_search to build the full-text index"
+    return result
+
+
+def _install_product_search(tenant: Tenant, rebuild: bool) -> bool:
+    with tenant.db.writer() as conn:
+        return create_product_search(conn, rebuild)
+
+
+@mcp.tool()
+async def install_product_search(rebuild: bool = False, database: str | None = None) -> str:
+    """Admin: builds the FTS5 product_search index over food_beverage_skus and inventory, kept in sync by triggers."""
+    budget = QueryBudget(0)
+    try:
+        with registry.use(database) as tenant:
+            built = await executor.run(budget, _install_product_search, tenant, rebuild)
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    return "✅ Built product_search index." if built else "✅ product_search index already installed; triggers are in place."
+
+
+def _sample(
+    tenant: Tenant, table: str, n: int, seed: int | None, budget: QueryBudget
+) -> tuple[list[tuple], list[str], str] | None:
+    with tenant.db.reader() as conn, budget.applied(conn):
+        if table not in {name for name, _ in user_tables(conn, include_views=True)}:
+            return None
+        return sample_rows(conn, table, n, seed)
+
+
+@mcp.tool()
+async def sample_table(
+    table: str,
+    n: int = 10,
+    seed: int | None = None,
+    output_format: OutputFormat = "text",
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+) -> str:
+    """Returns a uniform random sample of `n` rows from a table or view.
+
+    Much cheaper than ORDER BY RANDOM() on large tables. Pass `seed` to get the
+    same sample again.
+    """
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            sampled = await executor.run(budget, _sample, tenant, table, max(1, n), seed, budget)
+    except Exception as e:
+        if budget.stopped:
+            return budget.describe()
+        return f"❌ SQL Error: {e}"
+    if sampled is None:
+        return f"❌ No such table or view: {table}"
+    rows, columns, method = sampled
+    if not rows:
+        return f"✅ {table} is empty."
+    result = _format_page(rows, columns, None, 1, output_format)
+    if output_format == "text":
+        result += f"\n… {len(rows)} rows sampled by {method}"
+    return result
+
+
+def _approx_stats(
+    tenant: Tenant, table: str, column: str, quantiles: list[float], top_k: int, rebuild: bool, budget: QueryBudget
+) -> dict[str, Any] | str:
+    # Taken before the reader starts, so writes that land during the pass are seen as changes next time
+    version = (tenant.db.write_generation, *tenant.db.versions())
+    with tenant.db.reader() as conn, budget.applied(conn):
+        if table not in {name for name, _ in user_tables(conn, include_virtual=False)}:
+            return f"❌ No such table: {table}"
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({_quote_identifier(table)})")}:
+            return f"❌ No such column: {table}.{column}"
+        started = time.perf_counter()
+        sketch, mode, added = tenant.sketches.sketch(conn, table, column, rebuild, version)
+        report = {"table": table, "column": column, "refresh": mode, "rows_scanned": added}
+        report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report.update(sketch.summary(quantiles, top_k))
+        return report
+
+
+@mcp.tool()
+async def approx_stats(
+    table: str,
+    column: str,
+    quantiles: list[float] | None = None,
+    top_k: int = 10,
+    rebuild: bool = False,
+    timeout_ms: int = QUERY_TIMEOUT_MS,
+    database: str | None = None,
+) -> str:
+    """Approximate distinct count, quantiles and most frequent values of a column, with error bounds.
+
+    Much cheaper than COUNT(DISTINCT), ORDER BY ... OFFSET or GROUP BY on large
+    tables: the column is scanned once and later calls only read rows added
+    since. Pass `rebuild` to rescan after updates to existing rows.
+    """
+    quantiles = [q for q in (quantiles or [0.5, 0.9, 0.99]) if 0 <= q <= 1]
+    budget = QueryBudget(timeout_ms)
+    try:
+        with registry.use(database) as tenant:
+            report = await executor.run(
+                budget, _approx_stats, tenant, table, column, quantiles, max(1, top_k), rebuild, budget
+            )
+    except Exception as e:
+        if budget.stopped:
+            # Rows read before the deadline stay in the sketch, so calling again picks up from there
+            return budget.describe() + "; progress is kept, call again to continue"
+        return f"❌ SQL Error: {e}"
+    if isinstance(report, str):
+        return report
+    return json.dumps(report, indent=1, default=_json_value)
+
+
+def _format_offenders(offenders: list[dict[str, Any]]) -> str:
+    lines = []
+    for rank, o in enumerate(offenders, 1):
+        lines.append(
+            f"{rank}. {o['total_ms']:.0f} ms total, {o['count']} runs, avg {o['avg_ms']:.0f} ms, max {o['max_ms']:.0f} ms"
+            f" on {o['database']}"
+        )
+        lines.append(f"   {o['fingerprint']}")
+        lines.append(f"   last literals: {json.dumps(o['literals'], default=_json_value)}")
+        lines.append(f"   rows returned ~{o['avg_rows_returned']}, estimated rows scanned {o['rows_scanned_estimate']}")
+        lines.extend(f"   plan: {detail}" for detail in o["plan"] or [])
+        lines.extend(f"   ⚠️ {warning}" for warning in o["warnings"] or [])
+    return "\n".join(lines)
+
+
+@mcp.tool()
+async def slow_queries(
+    limit: int = 10, output_format: Literal["text", "json"] = "text", database: str | None = None
+) -> str:
+    """Lists the statements that spent the most total time above the slow query threshold.
+
+    Covers every database unless `database` is given.
+
+    Each entry has the normalized fingerprint, run count, total/avg/max time,
+    rows returned vs. estimated rows scanned, and the captured query plan.
+    Their full scans are also considered by `index_advice`.
+    """
+    budget = QueryBudget(0)
+    try:
+        offenders = await executor.run(budget, slow_log.offenders, max(1, limit), database)
+    except Exception as e:
+        return f"❌ Error reading {slow_log.path}: {e}"
+    if not offenders:
+        return f"✅ No statements slower than {slow_log.threshold_ms:g} ms have been logged."
+    if output_format == "json":
+        return json.dumps(offenders, indent=1, default=_json_value)
+    return _format_offenders(offenders)
+
+
+_REPORTED_PRAGMAS = ("cache_size", "mmap_size", "temp_store", "synchronous", "journal_mode", "page_size")
+_PRAGMA_NAMES = {
+    "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"},
+    "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"},
+}
+
+
+def _read_pragmas(conn: sqlite3.Connection) -> dict[str, Any]:
+    values = {}
+    for name in _REPORTED_PRAGMAS:
+        value = conn.execute(f"PRAGMA {name}").fetchone()[0]
+        values[name] = _PRAGMA_NAMES.get(name, {}).get(value, value)
+    return values
+
+
+def _connection_profile(tenant: Tenant) -> dict[str, Any]:
+    with tenant.db.reader() as conn:
+        reader = _read_pragmas(conn)
+    with tenant.db.writer() as conn:
+        writer = _read_pragmas(conn)
+    profile = tenant.db.profile
+    return {"database": tenant.name, "profile": profile, "requested": PROFILES[profile], "reader": reader, "writer": writer}
+
+
+@mcp.tool()
+async def connection_profile(database: str | None = None) -> str:
+    """Reports the active performance profile and the pragmas in effect on reader and writer connections.
+
+    Values are read back from SQLite, so limits such as a build's maximum
+    mmap_size show up as they actually apply.
+    """
+    budget = QueryBudget(0)
+    try:
+        with registry.use(database) as tenant:
+            report = await executor.run(budget, _connection_profile, tenant)
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    return json.dumps(report, indent=1)
+
+
+def _schema(tenant: Tenant) -> dict[str, Any]:
+    return tenant.schema_cache.get()
+
+
+@mcp.tool()
+async def describe_schema(output_format: Literal["text", "json"] = "text", database: str | None = None) -> str:
+    """Describes every table and view: columns with types, primary and foreign keys, and indexes.
+
+    Call this instead of querying sqlite_master or PRAGMA table_info.
+    """
+    budget = QueryBudget(0)
+    try:
+        with registry.use(database) as tenant:
+            schema = await executor.run(budget, _schema, tenant)
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    return json.dumps(schema) if output_format == "json" else format_schema(schema)
+
+
+@mcp.resource(
+    "schema://database",
+    name="database_schema",
+    description="Tables, columns, foreign keys and indexes of the SQLite database",
+    mime_type="application/json",
+)
+async def schema_resource() -> str:
+    with registry.use() as tenant:
+        return json.dumps(await executor.run(QueryBudget(0), _schema, tenant))
+
+
+@mcp.resource(
+    "schema://databases/{database}",
+    name="tenant_database_schema",
+    description="Tables, columns, foreign keys and indexes of a database by identifier",
+    mime_type="application/json",
+)
+async def tenant_schema_resource(database: str) -> str:
+    with registry.use(database) as tenant:
+        return json.dumps(await executor.run(QueryBudget(0), _schema, tenant))
+
+
+@mcp.tool()
+async def list_databases() -> str:
+    """Lists the database identifiers tools accept in `database`, and which databases are open with their
+    connection, file descriptor and memory use against the server's budgets.
+    """
+    try:
+        stats = await executor.run(QueryBudget(0), registry.stats)
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    return json.dumps(stats, indent=1)
+
+
+@mcp.tool()
+async def server_stats(output_format: Literal["json", "prometheus"] = "json", database: str | None = None) -> str:
+    """Reports query_data latency histograms per phase (connection wait, parse, exec, fetch, serialise),
+    rows and bytes returned, cache hits, plus the result cache and SQL thread pool counters.
+    """
+    if output_format == "prometheus":
+        return query_metrics.prometheus()
+    try:
+        with registry.use(database) as tenant:
+            cache = await executor.run(QueryBudget(0), tenant.result_cache.stats)
+    except UnknownDatabaseError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    # Read after the cache stats so the pool counters don't include this call's own work
+    return json.dumps({"query_data": query_metrics.stats(), "cache": cache, "executor": executor.stats()}, indent=1)
+
+
+@mcp.tool()
+async def cache_stats(database: str | None = None) -> str:
+    """Reports hit/miss counters and memory use of the read result cache"""
+    try:
+        with registry.use(database) as tenant:
+            return json.dumps(await executor.run(QueryBudget(0), tenant.result_cache.stats))
+    except UnknownDatabaseError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+
+
+@mcp.tool()
+def executor_stats() -> str:
+    """Reports queue depth, active workers and queue wait times of the SQL thread pool"""
+    return json.dumps(executor.stats())
 
 # You can add more tools here, like schema_introspection(), get_table_names(), etc.
 
 # Start the server
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite MCP server")
+    parser.add_argument("--profile", choices=list(PROFILES), default=PROFILE, help="connection pragma profile (default: $SQLITE_PROFILE or default)")
+    args = parser.parse_args()
+    registry.profile = args.profile
     mcp.run(transport="stdio")
@@ -0,0 +1,153 @@
+import math
+import random
+import hashlib
+from typing import Any, Hashable
+
+
+def _hash64(value: Any) -> int:
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2**p registers, relative standard error 1.04 / sqrt(2**p)"""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value: Any) -> None:
+        h = _hash64(value)
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        # Position of the leftmost 1-bit in the remaining 64 - p bits
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return round(estimate)
+
+
+class KLL:
+    """Quantile sketch (Karnin, Lang, Liberty); rank error is roughly 1.7 / k with high probability"""
+
+    def __init__(self, k: int = 200, c: float = 2 / 3, seed: int | None = None):
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.compactors: list[list[Any]] = []
+        self.size = 0
+        self.max_size = 0
+        self._rng = random.Random(seed)
+        self._grow()
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _grow(self) -> None:
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _compress(self) -> None:
+        for height in range(len(self.compactors)):
+            if len(self.compactors[height]) >= self._capacity(height):
+                if height + 1 >= len(self.compactors):
+                    self._grow()
+                items = sorted(self.compactors[height])
+                # An odd item out stays behind; the rest are halved, keeping a random half
+                keep = [items.pop()] if len(items) % 2 else []
+                self.compactors[height + 1].extend(items[self._rng.randint(0, 1)::2])
+                self.compactors[height] = keep
+                self.size = sum(len(c) for c in self.compactors)
+                if self.size < self.max_size:
+                    break
+
+    def add(self, value: Any) -> None:
+        self.compactors[0].append(value)
+        self.size += 1
+        self.n += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    @property
+    def rank_error(self) -> float:
+        return 1.7 / self.k
+
+    def quantiles(self, qs: list[float]) -> dict[float, Any]:
+        weighted = sorted(
+            (item, 1 << height) for height, compactor in enumerate(self.compactors) for item in compactor
+        )
+        if not weighted:
+            return {q: None for q in qs}
+        total = sum(w for _, w in weighted)
+        result = {}
+        for q in qs:
+            target = q * total
+            cumulative = 0
+            value = weighted[-1][0]
+            for item, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    value = item
+                    break
+            result[q] = value
+        return result
+
+
+class SpaceSaving:
+    """Heavy hitters (Metwally et al.) with k counters; each count overestimates by at most n / k"""
+
+    def __init__(self, k: int = 64):
+        self.k = k
+        self.n = 0
+        self.counts: dict[Hashable, int] = {}
+        self.errors: dict[Hashable, int] = {}
+        # Counters found at the minimum by the last scan; entries go stale when incremented
+        self._floor: list[Hashable] = []
+        self._floor_count = 0
+
+    def add(self, value: Hashable) -> None:
+        self.n += 1
+        if value in self.counts:
+            self.counts[value] += 1
+        elif len(self.counts) < self.k:
+            self.counts[value] = 1
+            self.errors[value] = 0
+        else:
+            # Evict the smallest counter; the newcomer inherits its count as possible overcount
+            victim = self._pop_minimum()
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[value] = floor + 1
+            self.errors[value] = floor
+
+    def _pop_minimum(self) -> Hashable:
+        while self._floor:
+            key = self._floor.pop()
+            if key in self.counts and self.counts[key] == self._floor_count:
+                return key
+        # One O(k) scan finds every counter at the minimum, amortising it over that many evictions
+        self._floor_count = min(self.counts.values())
+        self._floor = [key for key, count in self.counts.items() if count == self._floor_count]
+        return self._floor.pop()
+
+    @property
+    def max_error(self) -> int:
+        return self.n // self.k
+
+    def top(self, limit: int) -> list[tuple[Hashable, int, int]]:
+        """(value, estimated count, max overcount), most frequent first"""
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [(value, count, self.errors[value]) for value, count in ranked]
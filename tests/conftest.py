@@ -0,0 +1,36 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# mcp_server reads its configuration at import time, so point it at a scratch copy of the demo database first
+_scratch = Path(tempfile.mkdtemp(prefix="mcp-sqlite-tests-"))
+shutil.copy(ROOT / "database.db", _scratch / "database.db")
+os.environ["SQLITE_DB_PATH"] = str(_scratch / "database.db")
+os.environ["SQLITE_SLOW_LOG_PATH"] = str(_scratch / "slow_queries.jsonl")
+os.environ["SQLITE_ANALYZE_INTERVAL_SECONDS"] = "0"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def server():
+    """Runs the server lifespan once: it shuts the shared worker pool down on exit, so it can't be re-entered"""
+    import mcp_server
+
+    # Its own loop, kept open: asyncio.run would close the lifespan generator as soon as it returned
+    loop = asyncio.new_event_loop()
+    lifespan = mcp_server.server_lifespan(mcp_server.mcp)
+    loop.run_until_complete(lifespan.__aenter__())
+    yield
+    loop.run_until_complete(lifespan.__aexit__(None, None, None))
+    loop.close()
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_scratch, ignore_errors=True)
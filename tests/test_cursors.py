@@ -0,0 +1,23 @@
+import asyncio
+import re
+
+import pytest
+
+import mcp_server
+
+
+def test_fetch_after_close_reports_expired_instead_of_using_the_reader():
+    async def run():
+        page = await mcp_server.query_data("SELECT * FROM purchase_orders", page_rows=2)
+        token = re.search(r'cursor="([^"]+)"', page).group(1)
+        with mcp_server.registry.use(None) as tenant:
+            # What a fetch_more racing close_cursor (or the idle sweep) holds on to
+            server_cursor = tenant.cursors.get(token)
+            assert tenant.cursors.close(token)
+            with pytest.raises(mcp_server.CursorExpiredError):
+                mcp_server._fetch_page(server_cursor, 2, mcp_server.QueryBudget(0))
+            # Releasing again must not hand the reader back to the pool twice
+            tenant.cursors._release(server_cursor)
+        return await mcp_server.fetch_more(token)
+
+    assert "expired cursor" in asyncio.run(run())
@@ -0,0 +1,20 @@
+import asyncio
+
+import mcp_server
+
+
+def test_explain_query_sees_index_created_by_apply_index_advice():
+    sql = "SELECT * FROM purchase_orders WHERE user_id = 3"
+
+    async def run():
+        await mcp_server.query_data(sql)
+        # Explaining first leaves the old plan in the pooled reader's statement cache
+        before = await mcp_server.explain_query(sql)
+        applied = await mcp_server.apply_index_advice()
+        after = await mcp_server.explain_query(sql)
+        return before, applied, after
+
+    before, applied, after = asyncio.run(run())
+    assert "SCAN purchase_orders" in before
+    assert "idx_purchase_orders_user_id" in applied
+    assert "USING INDEX idx_purchase_orders_user_id" in after
@@ -0,0 +1,61 @@
+import bisect
+import collections
+import random
+
+from sketches import KLL, HyperLogLog, SpaceSaving
+
+
+def test_hyperloglog_estimates_distinct_count_within_two_percent():
+    rng = random.Random(7)
+    values = [rng.randrange(1 << 40) for _ in range(50_000)]
+    hll = HyperLogLog()
+    # Every value seen three times: repeats must not move the estimate
+    for value in values * 3:
+        hll.add(value)
+    true_count = len(set(values))
+    assert abs(hll.count() - true_count) <= 0.02 * true_count
+
+
+def test_hyperloglog_small_cardinality_uses_linear_counting():
+    hll = HyperLogLog()
+    for value in range(500):
+        hll.add(f"sku-{value}")
+    assert abs(hll.count() - 500) <= 10
+
+
+def test_kll_quantile_rank_error_within_epsilon():
+    rng = random.Random(11)
+    values = [rng.gauss(100, 25) for _ in range(100_000)]
+    kll = KLL(seed=3)
+    for value in values:
+        kll.add(value)
+    ordered = sorted(values)
+    qs = [i / 20 for i in range(1, 20)] + [0.01, 0.99]
+    for q, estimate in kll.quantiles(qs).items():
+        rank = bisect.bisect_right(ordered, estimate) / len(ordered)
+        assert abs(rank - q) <= kll.rank_error, (q, rank)
+    assert kll.n == len(values)
+    # Bounded memory: far fewer items retained than were added
+    assert kll.size < len(values) // 50
+
+
+def test_spacesaving_top_k_contains_true_heavy_hitters():
+    rng = random.Random(5)
+    # Zipf-like: the value of rank r appears about 20000 / r times, with a long tail of singletons
+    stream = [f"v{r}" for r in range(1, 2001) for _ in range(max(1, 20_000 // r))]
+    stream += [f"tail{i}" for i in range(20_000)]
+    rng.shuffle(stream)
+    sketch = SpaceSaving(k=64)
+    for value in stream:
+        sketch.add(value)
+    truth = collections.Counter(stream)
+
+    # Anything above n / k is guaranteed a counter, and its estimate can't fall below its true count
+    heavy = {value for value, count in truth.items() if count > sketch.n / sketch.k}
+    assert heavy
+    top = sketch.top(10)
+    assert heavy <= {value for value, _, _ in top}
+    for value, count, overcount in top:
+        # Counts never undercount, and overcount by no more than they admit to
+        assert count - overcount <= truth[value] <= count
+        assert overcount <= sketch.max_error